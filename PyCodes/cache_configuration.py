@@ -0,0 +1,180 @@
+import numpy as np
+import os
+import json
+import hashlib
+
+class CacheConfiguration():
+
+    def __init__(self, directory, paths, version=1):
+        super().__init__()
+        ## each layout version has its own folder, so that instances of different versions do not overwrite each other
+        self.directory = '{}Cache/v{}/'.format(directory, version)
+        self.paths = paths
+        self.version = version
+        ## signatures of the files that the arrays of this instance were loaded from or saved with
+        self.files = None
+        self.path_manifest = '{}manifest.json'.format(self.directory)
+
+    @staticmethod
+    def get_content_hash(path, blocksize=2**20):
+        """
+
+        """
+        h = hashlib.sha1()
+        with open(path, 'rb') as data_file:
+            for block in iter(lambda : data_file.read(blocksize), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def get_file_signature(path):
+        """
+
+        """
+        stat = os.stat(path)
+        return {'size' : stat.st_size, 'mtime' : stat.st_mtime_ns}
+
+    def get_array_path(self, key):
+        """
+
+        """
+        return '{}{}.npy'.format(self.directory, key)
+
+    def get_signatures(self):
+        """
+
+        """
+        signatures = dict()
+        for key, path in self.paths.items():
+            signature = self.get_file_signature(path)
+            signature['hash'] = self.get_content_hash(path)
+            signatures[key] = signature
+        return signatures
+
+    @staticmethod
+    def is_same_files(files, other_files):
+        """
+
+        """
+        if (files is None) or (other_files is None) or (set(files.keys()) != set(other_files.keys())):
+            return False
+        ## modification times can change without a change of content
+        return all((files[key]['size'] == other_files[key]['size']) and (files[key]['hash'] == other_files[key]['hash']) for key in files)
+
+    def load_manifest(self):
+        """
+
+        """
+        try:
+            with open(self.path_manifest, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != self.version:
+            return None
+        return manifest
+
+    def save_manifest(self, manifest):
+        """
+
+        """
+        temporary_path = '{}.{}.tmp'.format(self.path_manifest, os.getpid())
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+        os.replace(temporary_path, self.path_manifest)
+
+    def is_valid(self, manifest):
+        """
+
+        """
+        if manifest is None:
+            return False
+        files = manifest['files']
+        if set(files.keys()) != set(self.paths.keys()):
+            return False
+        is_touched = False
+        for key, path in self.paths.items():
+            try:
+                signature = self.get_file_signature(path)
+            except OSError:
+                return False
+            if signature['size'] != files[key]['size']:
+                return False
+            if signature['mtime'] != files[key]['mtime']:
+                ## same size but touched since caching; only the content hash can decide
+                if self.get_content_hash(path) != files[key]['hash']:
+                    return False
+                files[key]['mtime'] = signature['mtime']
+                is_touched = True
+        for key in manifest['arrays']:
+            if not os.path.isfile(self.get_array_path(key)):
+                return False
+        if is_touched:
+            self.save_manifest(manifest)
+        return True
+
+    def load(self, mmap_mode='r'):
+        """
+
+        """
+        manifest = self.load_manifest()
+        if not self.is_valid(manifest):
+            return None
+        self.files = manifest['files']
+        return {key : np.load(self.get_array_path(key), mmap_mode=mmap_mode, allow_pickle=False) for key in manifest['arrays']}
+
+    def save_arrays(self, arrays):
+        """
+
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        for key, value in arrays.items():
+            value = np.asarray(value)
+            if value.dtype == object:
+                raise ValueError("cannot cache object array: {}".format(key))
+            temporary_path = '{}{}.{}.tmp.npy'.format(self.directory, key, os.getpid())
+            np.save(temporary_path, value, allow_pickle=False)
+            os.replace(temporary_path, self.get_array_path(key))
+
+    def save(self, arrays, signatures):
+        """
+
+        """
+        self.save_arrays(arrays)
+        manifest = {'version' : self.version, 'files' : signatures, 'arrays' : sorted(arrays.keys())}
+        self.save_manifest(manifest)
+        self.files = signatures
+
+    def update(self, arrays, signatures):
+        """
+
+        """
+        ## arrays that changed with the files replace their cached versions, and the other cached arrays are kept;
+        ## this requires that the cache still holds the arrays of this instance
+        manifest = self.load_manifest()
+        if (manifest is None) or (not self.is_same_files(manifest['files'], self.files)):
+            return False
+        if not all(os.path.isfile(self.get_array_path(key)) for key in manifest['arrays']):
+            return False
+        self.save_arrays(arrays)
+        manifest['files'] = signatures
+        manifest['arrays'] = sorted(set(manifest['arrays']) | set(arrays.keys()))
+        self.save_manifest(manifest)
+        self.files = signatures
+        return True
+
+    def extend(self, arrays):
+        """
+
+        """
+        ## arrays derived from already cached data are only added to a cache that is still valid
+        ## and that was built from the same files, rather than rebuilt since by another instance
+        manifest = self.load_manifest()
+        if not self.is_valid(manifest):
+            return False
+        if not self.is_same_files(manifest['files'], self.files):
+            return False
+        self.save_arrays(arrays)
+        manifest['arrays'] = sorted(set(manifest['arrays']) | set(arrays.keys()))
+        self.save_manifest(manifest)
+        return True
@@ -0,0 +1,160 @@
+import numpy as np
+
+class CategoricalColumn():
+
+    def __init__(self, codes, categories):
+        super().__init__()
+        ## categories are sorted and unique, so that the order of codes is the order of strings
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values):
+        """
+
+        """
+        if isinstance(values, CategoricalColumn):
+            return values
+        categories, inverse = np.unique(np.asarray(values).ravel(), return_inverse=True)
+        return cls(inverse.astype(cls.get_code_dtype(categories.size)), categories)
+
+    @classmethod
+    def full(cls, size, value):
+        """
+
+        """
+        return cls(np.zeros(size, dtype=np.int8), np.array([value]))
+
+    @staticmethod
+    def get_code_dtype(ncategories):
+        """
+
+        """
+        for dtype in (np.int8, np.int16, np.int32):
+            if ncategories <= np.iinfo(dtype).max:
+                return dtype
+        return np.int64
+
+    @staticmethod
+    def concatenate(columns):
+        """
+
+        """
+        categories = columns[0].categories
+        if all((column.categories is categories) or np.array_equal(column.categories, categories) for column in columns[1:]):
+            return CategoricalColumn(np.concatenate([column.codes for column in columns]), categories)
+        ## columns of different dictionaries are encoded again
+        return CategoricalColumn.from_values(np.concatenate([np.asarray(column) for column in columns]))
+
+    @staticmethod
+    def get_combined_codes(columns):
+        """
+
+        """
+        ## one integer per combination of categories, ordered like the combined strings
+        codes = columns[0].codes.astype(np.int64)
+        for column in columns[1:]:
+            codes = codes * column.categories.size + column.codes
+        return codes
+
+    @property
+    def dtype(self):
+        return self.categories.dtype
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def size(self):
+        return self.codes.size
+
+    @property
+    def ndim(self):
+        return self.codes.ndim
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.categories.nbytes
+
+    def __len__(self):
+        return self.codes.size
+
+    def __iter__(self):
+        return iter(self.categories[self.codes])
+
+    def __getitem__(self, index):
+        codes = self.codes[index]
+        if np.ndim(codes) == 0:
+            return self.categories[codes]
+        return CategoricalColumn(codes, self.categories)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.categories[self.codes]
+        return values if dtype is None else values.astype(dtype)
+
+    def __repr__(self):
+        return '{}(size={}, ncategories={})'.format(type(self).__name__, self.codes.size, self.categories.size)
+
+    def get_code(self, value):
+        """
+
+        """
+        i = np.searchsorted(self.categories, value)
+        if (i < self.categories.size) and (self.categories[i] == value):
+            return i
+        return -1
+
+    def get_bound(self, value, side):
+        """
+
+        """
+        return np.searchsorted(self.categories, value, side=side)
+
+    def __eq__(self, other):
+        if isinstance(other, str):
+            return self.codes == self.get_code(other)
+        if isinstance(other, CategoricalColumn) and ((other.categories is self.categories) or np.array_equal(other.categories, self.categories)):
+            return self.codes == other.codes
+        return np.asarray(self) == other
+
+    def __ne__(self, other):
+        return np.invert(self == other)
+
+    def __lt__(self, other):
+        if isinstance(other, str):
+            return self.codes < self.get_bound(other, 'left')
+        return np.asarray(self) < other
+
+    def __le__(self, other):
+        if isinstance(other, str):
+            return self.codes < self.get_bound(other, 'right')
+        return np.asarray(self) <= other
+
+    def __gt__(self, other):
+        if isinstance(other, str):
+            return self.codes >= self.get_bound(other, 'right')
+        return np.asarray(self) > other
+
+    def __ge__(self, other):
+        if isinstance(other, str):
+            return self.codes >= self.get_bound(other, 'left')
+        return np.asarray(self) >= other
+
+    def astype(self, dtype):
+        """
+
+        """
+        return np.asarray(self).astype(dtype)
+
+    def tolist(self):
+        """
+
+        """
+        return self.categories[self.codes].tolist()
+
+    def copy(self):
+        """
+
+        """
+        return CategoricalColumn(np.array(self.codes), self.categories)
@@ -0,0 +1,57 @@
+import numpy as np
+
+class CompactConfiguration():
+
+    def __init__(self):
+        super().__init__()
+        ## narrower types make ordinary arithmetic (such as percentages of counts) overflow silently
+        self.dtypes = (np.int32, np.int64)
+
+    @staticmethod
+    def get_sentinel(dtype):
+        """
+
+        """
+        ## missing counts are stored as the smallest value of the integer type
+        return np.iinfo(dtype).min
+
+    def get_compact_matrix(self, matrix, dtype=None):
+        """
+
+        """
+        matrix = np.asarray(matrix)
+        if matrix.dtype.kind in ('i', 'u'):
+            matrix = self.get_float_matrix(matrix)
+        is_missing = np.isnan(matrix)
+        values = matrix[np.invert(is_missing)]
+        if np.any(values != np.round(values)):
+            ## fractional counts are kept as floats
+            return matrix
+        lower, upper = (values.min(), values.max()) if values.size > 0 else (0, 0)
+        dtypes = self.dtypes if dtype is None else [_dtype for _dtype in self.dtypes if np.dtype(_dtype).itemsize >= np.dtype(dtype).itemsize]
+        for dtype in dtypes:
+            if (self.get_sentinel(dtype) < lower) and (upper <= np.iinfo(dtype).max):
+                break
+        else:
+            return matrix
+        data = np.where(is_missing, self.get_sentinel(dtype), matrix).astype(dtype)
+        return data
+
+    @staticmethod
+    def is_compact(matrix):
+        """
+
+        """
+        return np.asarray(matrix).dtype.kind == 'i'
+
+    @staticmethod
+    def get_float_matrix(matrix):
+        """
+
+        """
+        matrix = np.asarray(matrix)
+        if not CompactConfiguration.is_compact(matrix):
+            return matrix.astype(float, copy=False)
+        values = matrix.astype(float)
+        values[matrix == CompactConfiguration.get_sentinel(matrix.dtype)] = np.nan
+        return values
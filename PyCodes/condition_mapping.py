@@ -1,6 +1,11 @@
 import numpy as np
 from scipy.stats import sem
+from scipy.spatial import cKDTree
+from categorical_column import CategoricalColumn
+from compact_configuration import CompactConfiguration
 import operator
+from collections import OrderedDict
+import functools
 
 class UnitedStatesMapping():
 
@@ -64,6 +69,7 @@ class UnitedStatesMapping():
             'Wyoming': 'WY'}
         self.name_to_abbreviation = state_mapping
         self.abbreviation_to_name = {value : key for key, value in state_mapping.items()}
+        self.abbreviation_aliases = {'D.C.' : 'DC'}
 
 class ConditionMapping():
 
@@ -80,15 +86,58 @@ class ConditionMapping():
         self.comparisons['lesser than'] = operator.lt
         self.comparisons['lesser than or equal'] = operator.le
         self.comparisons['not equal'] = operator.ne
-
+        ## built once; these are looked up for every search condition
+        self._types = {}
+        self._types['collective'] = (tuple, list, np.ndarray)
+        self._types['numerical'] = (float, int, np.float, np.int)
+        self._types['element'] = (str, float, int, np.float, np.int, np.int64, bool)
+        self._additional_comparisons = {}
+        self._additional_comparisons['nearest'] = lambda data, value : self.from_nearest(data, value)
+        self._additional_comparisons['nearest forward'] = lambda data, value : self.from_nearest_forward(data, value)
+        self._additional_comparisons['nearest backward'] = lambda data, value : self.from_nearest_backward(data, value)
+        self._statistical_values = {}
+        self._statistical_values['mean'] = lambda args : np.mean(args)
+        self._statistical_values['median'] = lambda args : np.median(args)
+        self._statistical_values['standard deviation'] = lambda args : np.std(args)
+        self._statistical_values['standard error'] = lambda args : sem(args)
+        self._vector_modifiers = {}
+        self._vector_modifiers['delta'] = lambda args : np.diff(args)
+        self._vector_modifiers['absolute delta'] = lambda args : np.abs(np.diff(args))
+        self._vector_modifiers['cumulative sum'] = lambda args : np.cumsum(args)
+        self._vector_modifiers['absolute cumulative sum'] = lambda args : np.cumsum(np.abs(args))
+        ## matrix counterparts operate along the date axis of (regions, dates) arrays
+        self._matrix_modifiers = {}
+        self._matrix_modifiers['delta'] = lambda args : self.get_matrix_delta(args)
+        self._matrix_modifiers['absolute delta'] = lambda args : np.abs(self.get_matrix_delta(args))
+        self._matrix_modifiers['cumulative sum'] = lambda args : np.cumsum(args, axis=1)
+        self._matrix_modifiers['absolute cumulative sum'] = lambda args : np.cumsum(np.abs(args), axis=1)
+        self._matrix_statistics = {}
+        self._matrix_statistics['mean'] = lambda args, axis : np.nanmean(args, axis=axis, keepdims=True)
+        self._matrix_statistics['median'] = lambda args, axis : np.nanmedian(args, axis=axis, keepdims=True)
+        self._matrix_statistics['standard deviation'] = lambda args, axis : np.nanstd(args, axis=axis, keepdims=True)
+        self._matrix_statistics['standard error'] = lambda args, axis : sem(args, axis=axis, nan_policy='omit')
+        self._reducers = {}
+        self._reducers['latest'] = lambda args, axis : np.take(args, -1, axis=axis)
+        self._reducers['earliest'] = lambda args, axis : np.take(args, 0, axis=axis)
+        self._reducers['maximum'] = lambda args, axis : np.nanmax(args, axis=axis)
+        self._reducers['minimum'] = lambda args, axis : np.nanmin(args, axis=axis)
+        self._reducers['mean'] = lambda args, axis : np.nanmean(args, axis=axis)
+        self._reducers['median'] = lambda args, axis : np.nanmedian(args, axis=axis)
+        self._reducers['total'] = lambda args, axis : np.nansum(args, axis=axis)
 
     @property
     def types(self):
-        res = {}
-        res['collective'] = (tuple, list, np.ndarray)
-        res['numerical'] = (float, int, np.float, np.int)
-        res['element'] = (str, float, int, np.float, np.int, np.int64, bool)
-        return res
+        return self._types
+
+    @staticmethod
+    def get_matrix_delta(data):
+        """
+
+        """
+        ## the first date has no previous date; np.diff(..., prepend=np.nan) requires numpy 1.16
+        delta = np.full(data.shape, np.nan)
+        delta[:, 1:] = np.diff(data, axis=1)
+        return delta
 
     @staticmethod
     def from_nearest(data, value):
@@ -134,29 +183,27 @@ class ConditionMapping():
 
     @property
     def additional_comparisons(self):
-        fmap = {}
-        fmap['nearest'] = lambda data, value : self.from_nearest(data, value)
-        fmap['nearest forward'] = lambda data, value : self.from_nearest_forward(data, value)
-        fmap['nearest backward'] = lambda data, value : self.from_nearest_backward(data, value)
-        return fmap
+        return self._additional_comparisons
 
     @property
     def statistical_values(self):
-        fmap = {}
-        fmap['mean'] = lambda args : np.mean(args)
-        fmap['median'] = lambda args : np.median(args)
-        fmap['standard deviation'] = lambda args : np.std(args)
-        fmap['standard error'] = lambda args : sem(args)
-        return fmap
+        return self._statistical_values
 
     @property
     def vector_modifiers(self):
-        fmap = {}
-        fmap['delta'] = lambda args : np.diff(args)
-        fmap['absolute delta'] = lambda args : np.abs(np.diff(args))
-        fmap['cumulative sum'] = lambda args : np.cumsum(args)
-        fmap['absolute cumulative sum'] = lambda args : np.cumsum(np.abs(args))
-        return fmap
+        return self._vector_modifiers
+
+    @property
+    def matrix_modifiers(self):
+        return self._matrix_modifiers
+
+    @property
+    def matrix_statistics(self):
+        return self._matrix_statistics
+
+    @property
+    def reducers(self):
+        return self._reducers
 
     def autocorrect_single_parameter_inputs(self, parameters, conditions, values):
         """
@@ -238,6 +285,18 @@ class ConditionMapping():
             raise ValueError("{} modifiers for {} parameters".format(nmodifiers, nparameters))
         return parameters, conditions, values, modifiers
 
+    @staticmethod
+    def autocorrect_reducers(parameters, reducers=None):
+        """
+
+        """
+        if (reducers is None) or (isinstance(reducers, str)):
+            reducers = [reducers for parameter in parameters]
+        nreducers, nparameters = len(reducers), len(parameters)
+        if nreducers != nparameters:
+            raise ValueError("{} reducers for {} parameters".format(nreducers, nparameters))
+        return reducers
+
     def get_indices(self, events, parameters, conditions, values, modifiers):
         """
 
@@ -246,19 +305,19 @@ class ConditionMapping():
         for parameter, condition, value, modifier in zip(parameters, conditions, values, modifiers):
             data = events[parameter]
             if modifier is not None:
-                if modifier in list(self.vector_modifiers.keys()):
+                if modifier in self.vector_modifiers:
                     f = self.vector_modifiers[modifier]
                     data = f(data)
                 else:
                     raise ValueError("invalid modifier: {}".format(modifier))
             if isinstance(value, str):
-                if value in list(self.statistical_values.keys()):
+                if value in self.statistical_values:
                     f = self.statistical_values[value]
                     try:
                         value = f(data)
                     except:
                         raise ValueError("invalid type(data) = {} for type(value) = {}".format(type(data), type(value)))
-            if condition in list(self.comparisons.keys()):
+            if condition in self.comparisons:
                 f = self.comparisons[condition]
                 res = f(data, value)
             else:
@@ -275,6 +334,42 @@ class ConditionMapping():
             indices.append(res)
         return np.array(indices)
 
+    def get_matrix_indices(self, events, parameters, conditions, values, modifiers, reducers, axis=0):
+        """
+
+        """
+        if axis not in (0, 1):
+            raise ValueError("invalid axis: {}".format(axis))
+        ## rows are selected by reducing over dates, and dates by reducing over rows
+        other_axis = 1 - axis
+        indices = []
+        for parameter, condition, value, modifier, reducer in zip(parameters, conditions, values, modifiers, reducers):
+            ## compact (integer) matrices are compared as floats with NaN in their missing cells
+            data = CompactConfiguration.get_float_matrix(events[parameter])
+            if modifier is not None:
+                data = self.matrix_modifiers[modifier](data)
+            if reducer is not None:
+                if (reducer in ('latest', 'earliest')) and (other_axis == 0):
+                    raise ValueError("reducer {} is only valid along the date axis".format(reducer))
+                with np.errstate(invalid='ignore'):
+                    data = self.reducers[reducer](data, other_axis)
+            if isinstance(value, str):
+                if value not in self.statistical_values:
+                    raise ValueError("invalid value: {}".format(value))
+                if data.ndim == 2:
+                    ## statistics of unreduced data are taken per region over dates
+                    value = self.matrix_statistics[value](data, 1)
+                    if np.ndim(value) == 1:
+                        value = value.reshape((-1, 1))
+                else:
+                    value = self.matrix_statistics[value](data, None).ravel()[0]
+            with np.errstate(invalid='ignore'):
+                res = self.comparisons[condition](data, value)
+            if res.ndim == 2:
+                res = np.any(res, axis=other_axis)
+            indices.append(res)
+        return np.array(indices)
+
     @staticmethod
     def select_conjunction(indices, apply_to, axis=0):
         """
@@ -288,27 +383,395 @@ class ConditionMapping():
             raise ValueError("invalid apply_to: {}".format(apply_to))
         return np.array(indices)
 
+class SpatialIndex():
+
+    def __init__(self, latitudes, longitudes, radius=6371.0088):
+        super().__init__()
+        ## mean radius of the Earth in km
+        self.radius = radius
+        self.conditions = ('nearest regions', 'within distance', 'within bounds')
+        ## number of values that specify each point (or box) of a condition
+        self.nvalues = {'nearest regions' : 3, 'within distance' : 3, 'within bounds' : 4}
+        latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+        self.rows = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+        self.latitudes = latitudes[self.rows]
+        self.longitudes = longitudes[self.rows]
+        ## chord lengths between points on the unit sphere are ordered like great-circle distances
+        self.tree = cKDTree(self.get_cartesian_coordinates(self.latitudes, self.longitudes))
+        self.latitude_order = np.argsort(self.latitudes, kind='stable')
+        self.sorted_latitudes = self.latitudes[self.latitude_order]
+
+    @staticmethod
+    def get_cartesian_coordinates(latitudes, longitudes):
+        """
+
+        """
+        phi, lam = np.radians(latitudes), np.radians(longitudes)
+        return np.stack((np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)), axis=-1)
+
+    def get_chord_length(self, distance):
+        """
+
+        """
+        return 2 * np.sin(np.minimum(distance / self.radius, np.pi) / 2)
+
+    def get_nearest_rows(self, points, n):
+        """
+
+        """
+        n = np.asarray(n, dtype=int)
+        k = min(int(np.max(n)), self.rows.size)
+        if k < 1:
+            return [np.array([], dtype=int) for point in points]
+        _, positions = self.tree.query(self.get_cartesian_coordinates(points[:, 0], points[:, 1]), k=k)
+        positions = positions.reshape((len(points), k))
+        return [self.rows[_positions[:_n]] for _positions, _n in zip(positions, n)]
+
+    def get_rows_within_distance(self, points, distances):
+        """
+
+        """
+        coordinates = self.get_cartesian_coordinates(points[:, 0], points[:, 1])
+        rows = [None for point in points]
+        ## one batched query per distinct radius
+        for distance in np.unique(distances):
+            loc = np.flatnonzero(distances == distance)
+            for i, positions in zip(loc, self.tree.query_ball_point(coordinates[loc], r=self.get_chord_length(distance))):
+                rows[i] = np.sort(self.rows[np.array(positions, dtype=int)])
+        return rows
+
+    def get_rows_within_bounds(self, bounds):
+        """
+
+        """
+        rows = []
+        for south, west, north, east in bounds:
+            lower = np.searchsorted(self.sorted_latitudes, south, side='left')
+            upper = np.searchsorted(self.sorted_latitudes, north, side='right')
+            positions = self.latitude_order[lower:upper]
+            longitudes = self.longitudes[positions]
+            if west <= east:
+                is_inside = (longitudes >= west) & (longitudes <= east)
+            else:
+                ## the box crosses the antimeridian
+                is_inside = (longitudes >= west) | (longitudes <= east)
+            rows.append(np.sort(self.rows[positions[is_inside]]))
+        return rows
+
+    def get_rows(self, condition, values):
+        """
+
+        """
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values.reshape((1, -1))
+        if condition == 'nearest regions':
+            if values.shape[1] != 3:
+                raise ValueError("nearest regions are given by (latitude, longitude, number of regions)")
+            return self.get_nearest_rows(values[:, :2], values[:, 2])
+        if condition == 'within distance':
+            if values.shape[1] != 3:
+                raise ValueError("regions within distance are given by (latitude, longitude, distance in km)")
+            return self.get_rows_within_distance(values[:, :2], values[:, 2])
+        if condition == 'within bounds':
+            if values.shape[1] != 4:
+                raise ValueError("regions within bounds are given by (south, west, north, east)")
+            return self.get_rows_within_bounds(values)
+        raise ValueError("invalid spatial condition: {}".format(condition))
+
+class SearchIndex():
+
+    def __init__(self, data, coordinates=None):
+        super().__init__()
+        self.hashes = {}
+        self.orders = {}
+        self.spatial = None
+        if coordinates is not None:
+            latitude, longitude = coordinates
+            self.spatial = SpatialIndex(data[latitude], data[longitude])
+        for key, value in data.items():
+            if isinstance(value, CategoricalColumn):
+                self.hashes[key] = self.get_categorical_index(value)
+                continue
+            value = np.asarray(value)
+            if value.ndim != 1:
+                continue
+            if value.dtype.kind in ('U', 'S'):
+                self.hashes[key] = self.get_hash_index(value)
+            elif value.dtype.kind in ('f', 'i', 'u'):
+                self.orders[key] = self.get_sorted_index(value)
+
+    @staticmethod
+    def get_hash_index(data):
+        """
+
+        """
+        unique_values, inverse = np.unique(data, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(unique_values.size + 1))
+        return {value : order[bounds[i]:bounds[i+1]] for i, value in enumerate(unique_values.tolist())}
+
+    @staticmethod
+    def get_categorical_index(column):
+        """
+
+        """
+        ## rows are grouped by their integer codes without comparing any strings
+        order = np.argsort(column.codes, kind='stable')
+        bounds = np.searchsorted(column.codes[order], np.arange(column.categories.size + 1))
+        return {value : order[bounds[i]:bounds[i+1]] for i, value in enumerate(column.categories.tolist())}
+
+    @staticmethod
+    def get_sorted_index(data):
+        """
+
+        """
+        order = np.argsort(data, kind='stable')
+        sorted_data = data[order]
+        ## NaN sorts last and never satisfies a comparison
+        nvalid = sorted_data.size - np.count_nonzero(np.isnan(sorted_data)) if sorted_data.dtype.kind == 'f' else sorted_data.size
+        return order[:nvalid], sorted_data[:nvalid]
+
+    def get_rows(self, parameter, condition, value):
+        """
+
+        """
+        if parameter in self.hashes:
+            if (condition in ('equal', 'equality', 'exact match')) and isinstance(value, str):
+                return self.hashes[parameter].get(value, np.array([], dtype=int))
+            return None
+        if parameter in self.orders:
+            if isinstance(value, (str, bool, np.bool_)) or (not isinstance(value, (int, float, np.number))):
+                return None
+            order, sorted_data = self.orders[parameter]
+            if condition in ('equal', 'equality', 'exact match'):
+                bounds = (np.searchsorted(sorted_data, value, side='left'), np.searchsorted(sorted_data, value, side='right'))
+            elif condition == 'greater than':
+                bounds = (np.searchsorted(sorted_data, value, side='right'), sorted_data.size)
+            elif condition == 'greater than or equal':
+                bounds = (np.searchsorted(sorted_data, value, side='left'), sorted_data.size)
+            elif condition in ('less than', 'lesser than'):
+                bounds = (0, np.searchsorted(sorted_data, value, side='left'))
+            elif condition in ('less than or equal', 'lesser than or equal'):
+                bounds = (0, np.searchsorted(sorted_data, value, side='right'))
+            else:
+                return None
+            return order[bounds[0]:bounds[1]]
+        return None
+
+class SearchPlan():
+
+    def __init__(self, parameters, conditions, values, apply_to, modifiers, axis=0, key=None, reducers=None):
+        super().__init__()
+        self.key = key
+        self.parameters = parameters
+        self.conditions = conditions
+        self.values = values
+        self.apply_to = apply_to
+        self.modifiers = modifiers
+        self.axis = axis
+        self.reducers = reducers
+
+    @property
+    def is_empty(self):
+        return self.parameters is None
+
 class Searcher(ConditionMapping):
 
-    def __init__(self, data):
+    def __init__(self, data, cachesize=256, indexed=False, coordinates=None):
         super().__init__()
         self.data = data
+        self.cachesize = cachesize
+        self.indexed = indexed
+        ## keys of the (latitude, longitude) data searched through the 'location' parameter
+        self.coordinates = coordinates
+        self.spatial_parameter = 'location'
+        self.index = SearchIndex(data, coordinates) if indexed else None
+        self._cache = OrderedDict()
+        self._signature = self.get_data_signature()
 
-    def search_indices(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None, axis=0):
+    @staticmethod
+    def get_hashable_key(args):
+        """
+
+        """
+        if isinstance(args, (tuple, list, np.ndarray)):
+            return tuple(Searcher.get_hashable_key(arg) for arg in args)
+        if isinstance(args, np.generic):
+            return args.item()
+        hash(args)
+        return args
+
+    def get_data_signature(self):
+        """
+
+        """
+        return tuple((key, id(value), np.shape(value)) for key, value in self.data.items())
+
+    def clear_cache(self):
+        """
+
+        """
+        self._cache.clear()
+        self._signature = self.get_data_signature()
+        if self.indexed:
+            self.index = SearchIndex(self.data, self.coordinates)
+
+    def compile(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None, axis=0, reducers=None):
         """
 
         """
         if ((parameters is None) and (conditions is None) and (values is None)):
-            key = list(self.data.keys())[0]
-            indices = np.arange(self.data[key].size).astype(int)
+            return SearchPlan(None, None, None, apply_to, None, axis, key=(None, axis))
+        if apply_to not in ('all', 'any'):
+            raise ValueError("invalid apply_to: {}".format(apply_to))
+        if (isinstance(parameters, str) and (parameters == self.spatial_parameter)) and isinstance(conditions, str) and self.is_spatial_point(values):
+            ## a single point is one condition rather than one condition per coordinate
+            values = [values]
+        parameters, conditions, values, modifiers = self.autocorrect_search_inputs(parameters, conditions, values, modifiers)
+        reducers = self.autocorrect_reducers(parameters, reducers)
+        for parameter, condition, value, modifier, reducer in zip(parameters, conditions, values, modifiers, reducers):
+            if parameter == self.spatial_parameter:
+                if (self.index is None) or (self.index.spatial is None):
+                    raise ValueError("no spatial index for parameter: {}".format(parameter))
+                if condition not in self.index.spatial.conditions:
+                    raise ValueError("invalid condition: {}".format(condition))
+                nvalues = self.index.spatial.nvalues[condition]
+                if not (self.is_spatial_point(value) and (len(value) == nvalues)):
+                    raise ValueError("invalid value for condition {} (expected a sequence of {} numbers): {}".format(condition, nvalues, value))
+                if (modifier is not None) or (reducer is not None) or (axis != 0):
+                    raise ValueError("spatial conditions select regions without modifiers or reducers")
+                continue
+            if parameter not in self.data:
+                raise ValueError("invalid parameter: {}".format(parameter))
+            if condition not in self.comparisons:
+                raise ValueError("invalid condition: {}".format(condition))
+            is_matrix = (np.ndim(self.data[parameter]) == 2)
+            _modifiers = self.matrix_modifiers if is_matrix else self.vector_modifiers
+            if (modifier is not None) and (modifier not in _modifiers):
+                raise ValueError("invalid modifier: {}".format(modifier))
+            if (reducer is not None) and ((not is_matrix) or (reducer not in self.reducers)):
+                raise ValueError("invalid reducer: {}".format(reducer))
+        try:
+            key = self.get_hashable_key((parameters, conditions, values, apply_to, modifiers, axis, reducers))
+        except TypeError:
+            key = None
+        return SearchPlan(parameters, conditions, values, apply_to, modifiers, axis, key, reducers)
+
+    @staticmethod
+    def is_spatial_point(value):
+        """
+
+        """
+        if not isinstance(value, (tuple, list, np.ndarray)):
+            return False
+        return (np.ndim(value) == 1) and all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in value)
+
+    @property
+    def is_matrix(self):
+        return all(np.ndim(value) == 2 for value in self.data.values())
+
+    def get_spatial_rows(self, plan):
+        """
+
+        """
+        ## conditions of the same kind are answered by one batched query
+        rows = dict()
+        for condition in set(plan.conditions):
+            loc = [i for i, (parameter, _condition) in enumerate(zip(plan.parameters, plan.conditions)) if (parameter == self.spatial_parameter) and (_condition == condition)]
+            if loc:
+                rows.update(zip(loc, self.index.spatial.get_rows(condition, [plan.values[i] for i in loc])))
+        return rows
+
+    def get_spatial_indices(self, plan):
+        """
+
+        """
+        key = list(self.data.keys())[0]
+        indices = np.zeros((len(plan.parameters), np.shape(self.data[key])[0]), dtype=bool)
+        loc = [i for i, parameter in enumerate(plan.parameters) if parameter != self.spatial_parameter]
+        if loc:
+            indices[loc] = self.get_indices(self.data, [plan.parameters[i] for i in loc], [plan.conditions[i] for i in loc], [plan.values[i] for i in loc], [plan.modifiers[i] for i in loc])
+        for i, rows in self.get_spatial_rows(plan).items():
+            indices[i, rows] = True
+        return indices
+
+    def get_indexed_indices(self, plan):
+        """
+
+        """
+        if (self.index is None) or (plan.axis != 0) or any(modifier is not None for modifier in plan.modifiers):
+            return None
+        spatial_rows = self.get_spatial_rows(plan) if self.spatial_parameter in plan.parameters else dict()
+        rows = []
+        for i, (parameter, condition, value) in enumerate(zip(plan.parameters, plan.conditions, plan.values)):
+            if i in spatial_rows:
+                rows.append(spatial_rows[i])
+                continue
+            _rows = self.index.get_rows(parameter, condition, value)
+            if _rows is None:
+                return None
+            rows.append(_rows)
+        if plan.apply_to == 'any':
+            rows = np.concatenate(rows)
         else:
-            parameters, conditions, values, modifiers = self.autocorrect_search_inputs(parameters, conditions, values, modifiers)
-            indices = self.get_indices(self.data, parameters, conditions, values, modifiers)
-            # print("\n .. {} PARTIAL INDICES {}:\n{}, {}\n".format(indices.shape, type(indices), indices, np.any(indices)))
-            indices = self.select_conjunction(indices, apply_to, axis=axis)
+            rows = functools.reduce(np.intersect1d, rows)
+        key = list(self.data.keys())[0]
+        indices = np.zeros(np.shape(self.data[key])[0], dtype=bool)
+        indices[rows] = True
+        return indices
+
+    def execute(self, plan):
+        """
+
+        """
+        if plan.is_empty:
+            key = list(self.data.keys())[0]
+            return np.arange(np.shape(self.data[key])[plan.axis]).astype(int)
+        if self.is_matrix:
+            indices = self.get_matrix_indices(self.data, plan.parameters, plan.conditions, plan.values, plan.modifiers, plan.reducers, axis=plan.axis)
+            indices = self.select_conjunction(indices, plan.apply_to, axis=0)
             if np.all(np.invert(indices)):
                 raise ValueError("no matches found")
+            return indices
+        indices = self.get_indexed_indices(plan)
+        if indices is not None:
+            if not np.any(indices):
+                raise ValueError("no matches found")
+            return indices
+        if self.spatial_parameter in plan.parameters:
+            indices = self.get_spatial_indices(plan)
+        else:
+            indices = self.get_indices(self.data, plan.parameters, plan.conditions, plan.values, plan.modifiers)
+        indices = self.select_conjunction(indices, plan.apply_to, axis=plan.axis)
+        if np.all(np.invert(indices)):
+            raise ValueError("no matches found")
         return indices
 
+    def search_indices(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None, axis=0, reducers=None):
+        """
 
-##
+        """
+        if isinstance(parameters, SearchPlan):
+            plan, key = parameters, parameters.key
+        else:
+            try:
+                key = self.get_hashable_key((parameters, conditions, values, apply_to, modifiers, axis, reducers))
+            except TypeError:
+                key = None
+            plan = None
+        signature = self.get_data_signature()
+        if signature != self._signature:
+            self.clear_cache()
+        if (key is not None) and (key in self._cache):
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if plan is None:
+            plan = self.compile(parameters, conditions, values, apply_to, modifiers, axis, reducers)
+        indices = self.execute(plan)
+        if (key is not None) and (self.cachesize > 0):
+            indices.setflags(write=False)
+            self._cache[key] = indices
+            if len(self._cache) > self.cachesize:
+                self._cache.popitem(last=False)
+        return indices
@@ -1,13 +1,32 @@
 from condition_mapping import *
 from visual_configuration import *
+from cache_configuration import *
+from metric_configuration import *
+from region_selection import *
+from categorical_column import *
+from compact_configuration import *
 
 import os
 import datetime
+import hashlib
 import csv
+from concurrent.futures import ProcessPoolExecutor
+
+class SearcherMapping(dict):
+
+    def __init__(self, loaders):
+        super().__init__()
+        self.loaders = loaders
+
+    def __missing__(self, key):
+        if key not in self.loaders:
+            raise KeyError(key)
+        self.loaders[key]()
+        return dict.__getitem__(self, key)
 
 class DataBase(VisualConfiguration):
 
-    def __init__(self, directory, ticksize=7, labelsize=8, textsize=5, titlesize=9, headersize=10, cellsize=15):
+    def __init__(self, directory, ticksize=7, labelsize=8, textsize=5, titlesize=9, headersize=10, cellsize=15, cache=False, storage='memory', lazy=False, metrics=False, compact=False):
         """
 
         """
@@ -16,81 +35,111 @@ class DataBase(VisualConfiguration):
         self.path_confirmed = '{}Data/time_series_19-covid-Confirmed.csv'.format(directory)
         self.path_dead = '{}Data/time_series_19-covid-Deaths.csv'.format(directory)
         self.path_recovered = '{}Data/time_series_19-covid-Recovered.csv'.format(directory)
-        self._raw_data = None
-        self._headers = None
-        self._datetimes = None
-        self._x = None
-        self._counties = None
-        self._provinces = None
-        self._countries = None
-        self._longitudes = None
-        self._latitudes = None
-        self._confirmed = None
-        self._dead = None
-        self._recovered = None
-        self._regions = dict()
-        self._timeseries = dict()
-        self._searchers = dict()
-        self.load_raw_data()
-        self.load_datetimes()
-        self.load_data()
-        self.load_regions()
-        self.load_timeseries()
+        self.paths = {'confirmed' : self.path_confirmed, 'dead' : self.path_dead, 'recovered' : self.path_recovered}
+        self.united_states = UnitedStatesMapping()
+        if storage not in ('memory', 'mmap'):
+            raise ValueError("invalid storage: {}".format(storage))
+        self.storage = storage
+        self.compact = compact
+        self.compact_configuration = CompactConfiguration()
+        self.cache = None
+        if cache or (storage == 'mmap'):
+            ## compact and float matrices are cached under different versions;
+            ## versions 1 and 2 stored the region names as strings, and version 4 stored compact matrices with masks
+            self.cache = CacheConfiguration(directory, self.paths, version=5 if compact else 3)
+        self.lazy = lazy
+        self.metric_configuration = MetricConfiguration()
+        self.include_metrics = metrics
+        self.reload()
 
     @property
     def raw_data(self):
+        if self._raw_data is None:
+            self.load_raw_data()
         return self._raw_data
 
     @property
     def headers(self):
+        if self._headers is None:
+            self.load_headers()
         return self._headers
 
     @property
     def datetimes(self):
+        if self._datetimes is None:
+            self.load_datetimes()
         return self._datetimes
 
     @property
     def x(self):
+        if self._x is None:
+            self.load_datetimes()
         return self._x
 
     @property
     def counties(self):
+        if self._counties is None:
+            self.load_identifiers()
         return self._counties
 
     @property
     def provinces(self):
+        if self._provinces is None:
+            self.load_identifiers()
         return self._provinces
 
     @property
     def countries(self):
+        if self._countries is None:
+            self.load_identifiers()
         return self._countries
 
     @property
     def longitudes(self):
+        if self._longitudes is None:
+            self.load_identifiers()
         return self._longitudes
 
     @property
     def latitudes(self):
+        if self._latitudes is None:
+            self.load_identifiers()
         return self._latitudes
 
     @property
     def confirmed(self):
+        if self._confirmed is None:
+            self.load_cases()
         return self._confirmed
 
     @property
     def dead(self):
+        if self._dead is None:
+            self.load_cases()
         return self._dead
 
     @property
     def recovered(self):
+        if self._recovered is None:
+            self.load_cases()
         return self._recovered
 
+    @property
+    def metrics(self):
+        if not self._metrics:
+            self.load_metrics()
+        return self._metrics
+
     @property
     def regions(self):
+        if not self._regions:
+            self.load_regions()
         return self._regions
 
     @property
     def timeseries(self):
+        if not self._timeseries:
+            self.load_timeseries()
         return self._timeseries
 
     @property
@@ -107,21 +156,168 @@ class DataBase(VisualConfiguration):
             return np.array([data for data in _data], dtype=str)
 
     @staticmethod
-    def autocorrect_row_ordering_by_province(data_a, data_b):
+    def get_header_from_file(path):
+        """
+
+        """
+        with open(path, 'r') as data_file:
+            _data = csv.reader(data_file, delimiter=',', quotechar='"')
+            return np.array(next(_data), dtype=str)
+
+    def stream_data_from_file(self, path, start=4, stop=None, blocksize=1024, digests=None):
+        """
+
+        """
+        ## digests maps the stop column of the hashed cells of each row onto a hash object
+        digests = dict() if digests is None else digests
+        with open(path, 'r') as data_file:
+            _data = csv.reader(data_file, delimiter=',', quotechar='"')
+            next(_data)
+            identifiers, values = [], []
+            for row in _data:
+                for _stop, digest in digests.items():
+                    digest.update('{}\n'.format('\x1f'.join(row[4:_stop])).encode())
+                identifiers.append(row[:4])
+                values.append(row[start:stop])
+                if len(identifiers) == blocksize:
+                    yield np.array(identifiers, dtype=str), self.autocorrect_timeseries(np.array(values, dtype=str))
+                    identifiers, values = [], []
+            if identifiers:
+                yield np.array(identifiers, dtype=str), self.autocorrect_timeseries(np.array(values, dtype=str))
+
+    @staticmethod
+    def append_columns(matrix, columns, buffer=None):
+        """
+
+        """
+        nrows, ncols = matrix.shape
+        n = ncols + columns.shape[1]
+        if (buffer is None) or (matrix.base is not buffer) or (buffer.shape[1] < n):
+            ## over-allocate so that subsequent daily appends do not copy the history
+            buffer = np.empty((nrows, max(n + 32, int(1.25 * n))), dtype=matrix.dtype)
+            buffer[:, :ncols] = matrix
+        buffer[:, ncols:n] = columns
+        return buffer[:, :n], buffer
+
+    def append_compact_columns(self, matrix, columns, buffer=None):
+        """
+
+        """
+        if not self.compact_configuration.is_compact(matrix):
+            return self.append_columns(matrix, columns, buffer)
+        columns = self.compact_configuration.get_compact_matrix(columns, matrix.dtype)
+        if columns.dtype != matrix.dtype:
+            ## appended counts that need a wider (or floating) type convert the whole matrix
+            matrix = self.compact_configuration.get_compact_matrix(matrix, columns.dtype) if self.compact_configuration.is_compact(columns) else self.compact_configuration.get_float_matrix(matrix)
+            buffer = None
+        return self.append_columns(matrix, columns, buffer)
+
+    @staticmethod
+    def get_concatenated_arrays(arrays, axis=0):
+        """
+
+        """
+        if all(isinstance(array, CategoricalColumn) for array in arrays):
+            return CategoricalColumn.concatenate(arrays)
+        return np.concatenate(arrays, axis=axis)
+
+    @staticmethod
+    def get_row_keys(data, columns):
+        """
+
+        """
+        keys = data[:, columns[0]]
+        for column in columns[1:]:
+            keys = np.core.defchararray.add(np.core.defchararray.add(keys, '\x1f'), data[:, column])
+        return keys
+
+    @staticmethod
+    def get_grouping(keys, is_aggregate):
+        """
+
+        """
+        ## within each group, the aggregate row (if any) sorts first
+        order = np.lexsort((np.invert(is_aggregate), keys))
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        return {'order' : order, 'starts' : starts, 'is_aggregate' : is_aggregate[order]}
+
+    @staticmethod
+    def get_group_totals(matrix, grouping):
+        """
+
+        """
+        matrix = CompactConfiguration.get_float_matrix(matrix)[grouping['order']]
+        is_finite = np.isfinite(matrix)
+        values = np.where(is_finite, matrix, 0)
+        totals = []
+        for is_member in (np.invert(grouping['is_aggregate']), grouping['is_aggregate']):
+            is_member = is_member[:, np.newaxis]
+            sums = np.add.reduceat(values * is_member, grouping['starts'], axis=0)
+            counts = np.add.reduceat(is_finite & is_member, grouping['starts'], axis=0)
+            sums[counts == 0] = np.nan
+            totals.append(sums)
+        ## an aggregate row (such as a whole state) overlaps its sub-rows (such as its counties);
+        ## the larger cumulative count is kept instead of their sum to avoid counting cases twice
+        return np.fmax(*totals)
+
+    @staticmethod
+    def get_row_key_labels(keys):
+        """
+
+        """
+        return [key.replace('\x1f', ', ').strip(', ') for key in keys]
+
+    def autocorrect_row_ordering_by_identifier(self, identifiers, reference='confirmed'):
+        """
+
+        """
+        columns = [0, 1]
+        keys = self.get_row_keys(identifiers[reference], columns)
+        if np.unique(keys).size != keys.size:
+            ## (province, country) is ambiguous; disambiguate by coordinates
+            columns = [0, 1, 2, 3]
+            keys = self.get_row_keys(identifiers[reference], columns)
+            if np.unique(keys).size != keys.size:
+                raise ValueError("duplicate rows in {} data".format(reference))
+        loc = np.argsort(keys)
+        sorted_keys = keys[loc]
+        orders = dict()
+        for case, data in identifiers.items():
+            if case == reference:
+                orders[case] = np.arange(keys.size)
+                continue
+            _keys = self.get_row_keys(data, columns)
+            if np.unique(_keys).size != _keys.size:
+                raise ValueError("duplicate rows in {} data".format(case))
+            positions = np.searchsorted(sorted_keys, _keys)
+            positions[positions == sorted_keys.size] = 0
+            is_matched = (sorted_keys[positions] == _keys)
+            order = np.full(keys.size, -1, dtype=int)
+            order[loc[positions[is_matched]]] = np.flatnonzero(is_matched)
+            if not np.all(is_matched):
+                labels = self.get_row_key_labels(_keys[np.invert(is_matched)])
+                raise ValueError("rows of {} data without match in {} data: {}".format(case, reference, labels))
+            if np.any(order < 0):
+                labels = self.get_row_key_labels(keys[order < 0])
+                raise ValueError("rows of {} data without match in {} data: {}".format(reference, case, labels))
+            orders[case] = order
+        return orders
+
+    @staticmethod
+    def get_row_slice(indices):
         """
 
         """
-        conditions = ((data_a[:, 1] != data_b[:, 1]) | (data_a[:, 0] != data_b[:, 0]))
-        if np.any(conditions):
-            loc = np.where(conditions)[0]
-            mapping = dict(zip(np.arange(loc.size).astype(int), loc))
-            for row in loc:
-                swap_conditions = ((data_b[:, 1][loc] == data_a[:, 1][row]) & (data_b[:, 0][loc] == data_a[:, 0][row]))
-                mapping_key = np.where(swap_conditions)[0]
-                if len(mapping_key) != 0:
-                    _row = mapping[mapping_key[0]]
-                    data_b[[_row, row]] = data_b[[row, _row]]
-        return data_a, data_b
+        indices = np.asarray(indices)
+        rows = np.flatnonzero(indices) if indices.dtype == bool else indices
+        if rows.size == 1:
+            return slice(rows[0], rows[0] + 1)
+        if rows.size > 1:
+            steps = np.diff(rows)
+            if (steps[0] > 0) and np.all(steps == steps[0]):
+                return slice(rows[0], rows[-1] + 1, steps[0])
+        return rows
 
     @staticmethod
     def autocorrect_timeseries(timeseries):
@@ -129,6 +325,37 @@ class DataBase(VisualConfiguration):
         timeseries[condition] = 'NaN'
         return timeseries.astype(float)
 
+    def autocorrect_provinces_and_counties(self, provinces):
+        """
+
+        """
+        provinces = np.where(provinces == '', 'N/A', provinces)
+        unique_provinces, inverse = np.unique(provinces, return_inverse=True)
+        heads, separators, tails = np.core.defchararray.partition(unique_provinces, ',').T
+        abbreviations = np.core.defchararray.strip(tails)
+        US = self.united_states
+        _provinces = unique_provinces.astype(object)
+        _counties = np.full(unique_provinces.size, 'N/A', dtype=object)
+        for i in np.flatnonzero(separators == ','):
+            abbreviation = US.abbreviation_aliases.get(abbreviations[i], abbreviations[i])
+            ## provinces such as 'Toronto, ON' are not US counties and are kept as they are
+            if abbreviation in US.abbreviation_to_name:
+                _provinces[i] = US.abbreviation_to_name[abbreviation]
+                _counties[i] = heads[i]
+        return _provinces.astype(str)[inverse], _counties.astype(str)[inverse]
+
+    def get_identifiers(self, data):
+        """
+
+        """
+        countries = data[:, 1]
+        provinces, counties = self.autocorrect_provinces_and_counties(data[:, 0])
+        longitudes = data[:, 2].astype(float)
+        latitudes = data[:, 3].astype(float)
+        ## region names repeat across rows and are stored as codes into their unique values
+        countries, provinces, counties = (CategoricalColumn.from_values(names) for names in (countries, provinces, counties))
+        return countries, provinces, counties, longitudes, latitudes
+
     @staticmethod
     def get_region_name(country, province, county):
         """
@@ -176,46 +403,311 @@ class DataBase(VisualConfiguration):
         _recovered = self.get_data_from_file(self.path_recovered)
         if not np.all((_confirmed[0, :] == _dead[0, :]) & (_dead[0, :] == _recovered[0, :])):
             raise ValueError("headers for confirmed/dead/recovered do not match")
-        self._raw_data = {'confirmed' : _confirmed, 'dead' : _dead, 'recovered' : _recovered}
-        self._headers = {'identifier' : _confirmed[0, :4], 'timeseries' : _confirmed[0, 4:]}
+        raw_data = {'confirmed' : _confirmed, 'dead' : _dead, 'recovered' : _recovered}
+        orders = self.autocorrect_row_ordering_by_identifier({key : value[1:, :4] for key, value in raw_data.items()})
+        self._raw_data = {key : np.concatenate((value[:1], value[1:][orders[key]]), axis=0) for key, value in raw_data.items()}
+
+    def load_headers(self):
+        if self.cache is not None:
+            self._signatures = self.cache.get_signatures()
+        _confirmed = self.get_header_from_file(self.path_confirmed)
+        _dead = self.get_header_from_file(self.path_dead)
+        _recovered = self.get_header_from_file(self.path_recovered)
+        if not (np.array_equal(_confirmed, _dead) and np.array_equal(_dead, _recovered)):
+            raise ValueError("headers for confirmed/dead/recovered do not match")
+        self._headers = {'identifier' : _confirmed[:4], 'timeseries' : _confirmed[4:]}
+
+    @staticmethod
+    def get_datetimes_from_headers(headers):
+        """
+
+        """
+        ## month/day/year headers are parsed in one pass into days since the epoch
+        months, _, dates = np.core.defchararray.partition(headers, '/').T
+        days, _, years = np.core.defchararray.partition(dates, '/').T
+        months, days, years = months.astype(int), days.astype(int), years.astype(int)
+        years[years < 100] += 2000
+        _datetimes = (years - 1970).astype('datetime64[Y]') + (months - 1).astype('timedelta64[M]')
+        return _datetimes.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')
 
     def load_datetimes(self):
-        _datetimes = []
-        dts = np.core.defchararray.split(self.headers['timeseries'], sep='/')
-        for dt in dts:
-            _datetimes.append(datetime.datetime(month=int(dt[0]), day=int(dt[1]), year=int('20' + dt[2])))
-        self._datetimes = np.array(_datetimes)
-        self._x = np.unique(_datetimes)
+        self._datetimes = self.get_datetimes_from_headers(self.headers['timeseries'])
+        self._x = np.unique(self._datetimes)
+
+    def autocorrect_date(self, value):
+        """
+
+        """
+        if isinstance(value, str) and ('/' in value):
+            return self.get_datetimes_from_headers(np.array([value]))[0]
+        return np.datetime64(value, 'D')
+
+    def get_nearest_date_index(self, value, direction='nearest'):
+        """
+
+        """
+        value = self.autocorrect_date(value)
+        n = self.x.size
+        i = int(np.searchsorted(self.x, value, side='left'))
+        if direction == 'forward':
+            if i == n:
+                raise ValueError("no forward-nearest date exists")
+            return i
+        if direction == 'backward':
+            if (i < n) and (self.x[i] == value):
+                return i
+            if i == 0:
+                raise ValueError("no backward-nearest date exists")
+            return i - 1
+        if direction != 'nearest':
+            raise ValueError("invalid direction: {}".format(direction))
+        if i == 0:
+            return 0
+        if i == n:
+            return n - 1
+        return i if (self.x[i] - value) < (value - self.x[i - 1]) else i - 1
+
+    def get_window(self, window=None, direction='nearest'):
+        """
+
+        """
+        if window is None:
+            return slice(None)
+        if isinstance(window, slice):
+            columns = window
+        elif isinstance(window, (int, np.integer)) and not isinstance(window, bool):
+            ## last number of days
+            if window < 1:
+                raise ValueError("invalid window: {}".format(window))
+            columns = slice(max(0, self.x.size - window), self.x.size)
+        elif isinstance(window, (tuple, list)):
+            if len(window) != 2:
+                raise ValueError("invalid window: {}".format(window))
+            start, stop = window
+            start = 0 if start is None else int(np.searchsorted(self.x, self.autocorrect_date(start), side='left'))
+            stop = self.x.size if stop is None else int(np.searchsorted(self.x, self.autocorrect_date(stop), side='right'))
+            columns = slice(start, stop)
+        else:
+            ## single date
+            i = self.get_nearest_date_index(window, direction)
+            columns = slice(i, i + 1)
+        if len(range(*columns.indices(self.x.size))) == 0:
+            raise ValueError("no dates found in window: {}".format(window))
+        return columns
 
     def load_data(self):
-        _confirmed, _dead = self.autocorrect_row_ordering_by_province(self.raw_data['confirmed'], self.raw_data['dead'])
-        _dead, _recovered = self.autocorrect_row_ordering_by_province(self.raw_data['dead'], self.raw_data['recovered'])
-        _recovered, _confirmed = self.autocorrect_row_ordering_by_province(self.raw_data['recovered'], self.raw_data['confirmed'])
-        self._countries = _confirmed[1:, 1]
-        _provinces = _confirmed[1:, 0]
-        _provinces[_provinces == ''] = 'N/A'
-        county_indices = np.core.defchararray.find(_provinces, ',')
-        _counties = ['N/A'] * county_indices.size
-        US = UnitedStatesMapping()
-        for i, (county_index, province) in enumerate(zip(county_indices, _provinces)):
-            if county_index >= 0:
-                try:
-                    abbreviation = province[county_index+2:].strip()
-                    _provinces[i] = US.abbreviation_to_name[abbreviation]
-                    _counties[i] = province[:county_index]
-                except:
-                    if 'D.C.' in province:
-                        _provinces[i] = 'District of Columbia'
-                        _counties[i] = 'Washington'
-                    else:
-                        raise ValueError("not yet implemented")
-        self._provinces = _provinces
-        self._counties = np.array(_counties)
-        self._longitudes = _confirmed[1:, 2].astype(float)
-        self._latitudes = _confirmed[1:, 3].astype(float)
-        self._confirmed = self.autocorrect_timeseries(_confirmed[1:, 4:])
-        self._dead = self.autocorrect_timeseries(_dead[1:, 4:])
-        self._recovered = self.autocorrect_timeseries(_recovered[1:, 4:])
+        self.load_identifiers()
+        self.load_cases()
+
+    def load_identifiers(self):
+        identifiers = dict()
+        for key, path in self.paths.items():
+            identifiers[key] = np.concatenate([block for block, _ in self.stream_data_from_file(path, start=4, stop=4)], axis=0)
+        orders = self.autocorrect_row_ordering_by_identifier(identifiers)
+        ## positions map each row of a file onto its aligned row
+        self._positions = {key : np.argsort(order) for key, order in orders.items()}
+        self._countries, self._provinces, self._counties, self._longitudes, self._latitudes = self.get_identifiers(identifiers['confirmed'])
+
+    def load_cases(self):
+        if self._positions is None:
+            self.load_identifiers()
+        shape = (self.countries.size, self.headers['timeseries'].size)
+        for key, path in self.paths.items():
+            positions = self._positions[key]
+            matrix = np.empty(shape, dtype=float)
+            row = 0
+            digest = hashlib.sha1()
+            for _, values in self.stream_data_from_file(path, start=4, digests={None : digest}):
+                if (row + values.shape[0] > shape[0]) or (values.shape[1] != shape[1]):
+                    raise ValueError("{} data changed while loading".format(key))
+                matrix[positions[row:row + values.shape[0]]] = values
+                row += values.shape[0]
+            if row != shape[0]:
+                raise ValueError("{} data changed while loading".format(key))
+            if self.compact:
+                matrix = self.compact_configuration.get_compact_matrix(matrix)
+            setattr(self, '_{}'.format(key), matrix)
+            ## the loaded cells are verified by update before new columns are appended
+            self._digests[key] = digest.hexdigest()
+        self.update_cached_data()
+
+    def load_cached_data(self):
+        """
+
+        """
+        if self.cache is None:
+            return False
+        arrays = self.cache.load(mmap_mode='r')
+        if arrays is None:
+            return False
+        self._headers = {'identifier' : arrays['identifier'], 'timeseries' : arrays['timeseries']}
+        self._datetimes = None
+        self._x = None
+        self._countries, self._provinces, self._counties = (CategoricalColumn(arrays['{} codes'.format(key)], arrays['{} categories'.format(key)]) for key in ('countries', 'provinces', 'counties'))
+        self._longitudes = arrays['longitudes']
+        self._latitudes = arrays['latitudes']
+        self._confirmed = arrays['confirmed']
+        self._dead = arrays['dead']
+        self._recovered = arrays['recovered']
+        self._digests = {key : str(arrays['{} digest'.format(key)]) for key in self.paths.keys() if '{} digest'.format(key) in arrays}
+        metric_keys = self.metric_configuration.keys
+        ## metrics that do not cover the dates of the cached cases are computed again
+        if ('metric window' in arrays) and (int(arrays['metric window']) == self.metric_configuration.window) and all((key in arrays) and (arrays[key].shape == self._confirmed.shape) for key in metric_keys):
+            self._metrics = {key : arrays[key] for key in metric_keys}
+        return True
+
+    def update_cached_data(self, keys=None):
+        """
+
+        """
+        if self.cache is None:
+            return
+        if keys is None:
+            self.save_cached_data()
+        elif not self.cache.update(self.get_cached_arrays(keys), self._signatures):
+            ## the cache was not saved from the data of this instance
+            self.save_cached_data()
+        if self.storage == 'mmap':
+            ## attach to the read-only cache files so that forked workers share pages
+            self._raw_data = None
+            if self.load_cached_data():
+                ## the private buffers of the appended matrices are no longer referenced
+                for key in ('confirmed', 'dead', 'recovered') + self.metric_configuration.keys:
+                    self._buffers.pop(key, None)
+            if self._regions:
+                self.load_regions()
+
+    def save_cached_data(self):
+        """
+
+        """
+        if (self.cache is None) or (self._signatures is None):
+            return
+        self.cache.save(self.get_cached_arrays(), self._signatures)
+
+    def get_cached_arrays(self, keys=None):
+        """
+
+        """
+        arrays = dict()
+        arrays['identifier'] = self.headers['identifier']
+        arrays['timeseries'] = self.headers['timeseries']
+        for key in ('countries', 'provinces', 'counties'):
+            column = getattr(self, key)
+            arrays['{} codes'.format(key)] = column.codes
+            arrays['{} categories'.format(key)] = column.categories
+        arrays['longitudes'] = self.longitudes
+        arrays['latitudes'] = self.latitudes
+        arrays['confirmed'] = self.confirmed
+        arrays['dead'] = self.dead
+        arrays['recovered'] = self.recovered
+        for key, digest in self._digests.items():
+            arrays['{} digest'.format(key)] = np.array(digest)
+        if self._metrics:
+            arrays.update(self.get_cached_metrics())
+        if keys is None:
+            return arrays
+        return {key : arrays[key] for key in keys if key in arrays}
+
+    def get_cached_metrics(self):
+        """
+
+        """
+        arrays = dict(self._metrics)
+        arrays['metric window'] = np.array(self.metric_configuration.window)
+        return arrays
+
+    def reload(self):
+        """
+
+        """
+        self._raw_data = None
+        self._headers = None
+        self._datetimes = None
+        self._x = None
+        self._counties = None
+        self._provinces = None
+        self._countries = None
+        self._longitudes = None
+        self._latitudes = None
+        self._confirmed = None
+        self._dead = None
+        self._recovered = None
+        self._regions = dict()
+        self._timeseries = dict()
+        self._metrics = dict()
+        self._rollups = dict()
+        self._row_keys = None
+        self._searchers = SearcherMapping({'region' : self.load_regions, 'timeseries' : self.load_timeseries})
+        self._signatures = None
+        self._buffers = dict()
+        self._positions = None
+        self._digests = dict()
+        is_cached = self.load_cached_data()
+        if self.lazy:
+            return
+        if not is_cached:
+            self.load_headers()
+            self.load_data()
+        self.load_datetimes()
+        self.load_regions()
+        self.load_timeseries()
+
+    def update(self):
+        """
+
+        """
+        if self._confirmed is None:
+            self.reload()
+            return None
+        if self.cache is not None:
+            self._signatures = self.cache.get_signatures()
+        ncolumns = self.headers['identifier'].size + self.headers['timeseries'].size
+        headers = {key : self.get_header_from_file(path) for key, path in self.paths.items()}
+        header = headers['confirmed']
+        if not (np.array_equal(header, headers['dead']) and np.array_equal(header, headers['recovered'])):
+            raise ValueError("headers for confirmed/dead/recovered do not match")
+        previous_header = np.concatenate((self.headers['identifier'], self.headers['timeseries']))
+        if (header.size < ncolumns) or (not np.array_equal(header[:ncolumns], previous_header)):
+            self.reload()
+            return None
+        if set(self._digests.keys()) != set(self.paths.keys()):
+            ## the loaded cells cannot be verified
+            self.reload()
+            return None
+        identifiers, values, digests = dict(), dict(), dict()
+        for key, path in self.paths.items():
+            digests[key] = {ncolumns : hashlib.sha1(), None : hashlib.sha1()}
+            blocks = list(self.stream_data_from_file(path, start=ncolumns, digests=digests[key]))
+            if digests[key][ncolumns].hexdigest() != self._digests[key]:
+                ## previously loaded cells were revised
+                self.reload()
+                return None
+            identifiers[key] = np.concatenate([block for block, _ in blocks], axis=0)
+            values[key] = np.concatenate([block for _, block in blocks], axis=0)
+        orders = self.autocorrect_row_ordering_by_identifier(identifiers)
+        previous_identifiers = (self.countries, self.provinces, self.counties, self.longitudes, self.latitudes)
+        if not all(np.array_equal(a, b) for a, b in zip(self.get_identifiers(identifiers['confirmed']), previous_identifiers)):
+            self.reload()
+            return None
+        nappended = header.size - ncolumns
+        if nappended == 0:
+            return 0
+        for key in ('confirmed', 'dead', 'recovered'):
+            matrix, self._buffers[key] = self.append_compact_columns(getattr(self, key), values[key][orders[key]], self._buffers.get(key))
+            setattr(self, '_{}'.format(key), matrix)
+            self._digests[key] = digests[key][None].hexdigest()
+        self.update_metrics(nappended)
+        self.update_rollups(nappended)
+        self._raw_data = None
+        self._headers = {'identifier' : header[:4], 'timeseries' : header[4:]}
+        self.load_datetimes()
+        ## identifiers and region columns are unchanged and are not written again
+        keys = ('timeseries', 'confirmed', 'dead', 'recovered') + tuple('{} digest'.format(key) for key in self.paths.keys()) + self.metric_configuration.keys
+        self.update_cached_data(keys)
+        if self._timeseries:
+            self.load_timeseries()
+        return nappended
 
     def load_regions(self):
         regions = dict()
@@ -225,112 +717,343 @@ class DataBase(VisualConfiguration):
         regions['longitude'] = self.longitudes
         regions['latitude'] = self.latitudes
         self._regions.update(regions)
-        self._searchers['region'] = Searcher(regions)
+        ## the 'longitude' column holds the Lat field of the CSSE files and the 'latitude' column holds the Long field
+        self._searchers['region'] = Searcher(regions, indexed=True, coordinates=('longitude', 'latitude'))
+
+    def load_metrics(self):
+        self._metrics = self.metric_configuration.get_metrics(self.confirmed, self.dead, self.recovered)
+        for key in self._metrics.keys():
+            self._buffers.pop(key, None)
+        if self.cache is not None:
+            self.cache.extend(self.get_cached_metrics())
+
+    def update_metrics(self, nappended):
+        """
+
+        """
+        if not self._metrics:
+            return
+        ## only the appended dates are computed, from the few dates before them
+        start = self.confirmed.shape[1] - nappended
+        columns = self.metric_configuration.get_metrics(self.confirmed, self.dead, self.recovered, start=start)
+        for key, value in columns.items():
+            self._metrics[key], self._buffers[key] = self.append_columns(self._metrics[key], value, self._buffers.get(key))
 
     def load_timeseries(self):
         timeseries = dict()
         timeseries['confirmed'] = self.confirmed
         timeseries['dead'] = self.dead
         timeseries['recovered'] = self.recovered
+        if self.include_metrics:
+            timeseries.update(self.metrics)
         self._timeseries.update(timeseries)
         self._searchers['timeseries'] = Searcher(timeseries)
 
-    def select_regions(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None):
+    def get_selection(self, indices=None):
+        """
+
+        """
+        if indices is None:
+            indices = np.arange(self.countries.size)
+        return RegionSelection(self, indices)
+
+    def get_selected_rows(self, indices):
+        """
+
+        """
+        if self.storage != 'mmap':
+            regions = {key : value[indices] for key, value in self.regions.items()}
+            timeseries = {key : value[indices] for key, value in self.timeseries.items()}
+            return regions, timeseries
+        ## evenly spaced rows are read through a slice, and other rows through row views, so that the cached matrices are not copied
+        rows = self.get_row_slice(indices)
+        regions = {key : value[rows] for key, value in self.regions.items()}
+        if isinstance(rows, slice):
+            timeseries = {key : value[rows] for key, value in self.timeseries.items()}
+        else:
+            timeseries = {key : RowView(value, rows) for key, value in self.timeseries.items()}
+        return regions, timeseries
+
+    def select_regions(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None, selection=False):
         """
 
         """
         S = self.searchers['region']
         indices = S.search_indices(parameters, conditions, values, apply_to, modifiers, axis=0)
-        regions = {key : value[indices] for key, value in self.regions.items()}
-        timeseries = {key : value[indices] for key, value in self.timeseries.items()}
-        return regions, timeseries
+        if selection:
+            return self.get_selection(indices)
+        return self.get_selected_rows(indices)
 
-    def select_timeseries(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None):
+    def select_timeseries(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None, reducers=None, axis=0, selection=False):
         """
 
         """
         S = self.searchers['timeseries']
-        raise ValueError("not yet implemented")
+        indices = S.search_indices(parameters, conditions, values, apply_to, modifiers, axis=axis, reducers=reducers)
+        if selection:
+            if axis != 0:
+                raise ValueError("selections contain regions; axis must be 0")
+            return self.get_selection(indices)
+        if axis == 0:
+            return self.get_selected_rows(indices)
+        datetimes = self.datetimes[indices]
+        timeseries = {key : value[:, indices] for key, value in self.timeseries.items()}
+        return datetimes, timeseries
+
+    def load_rollups(self, level):
+        if level == 'province':
+            regions = {'country' : self.countries, 'province' : self.provinces, 'county' : self.counties, 'longitude' : self.longitudes, 'latitude' : self.latitudes}
+            timeseries = {'confirmed' : self.confirmed, 'dead' : self.dead, 'recovered' : self.recovered}
+            ## codes of sorted categories group and order the rows like the names themselves
+            keys = CategoricalColumn.get_combined_codes((regions['country'], regions['province']))
+            is_aggregate = (regions['county'] == 'N/A')
+        elif level == 'country':
+            regions, timeseries = self.get_rollup('province')
+            keys = regions['country'].codes
+            ## a row without a province (such as mainland France) does not contain the other provinces
+            ## (such as its overseas territories) of its country, so the provinces are summed
+            is_aggregate = np.zeros(keys.size, dtype=bool)
+        else:
+            raise ValueError("invalid level: {}".format(level))
+        grouping = self.get_grouping(keys, is_aggregate)
+        first = grouping['order'][grouping['starts']]
+        _regions = {key : value[first] for key, value in regions.items()}
+        _regions['county'] = CategoricalColumn.full(first.size, 'N/A')
+        if level == 'country':
+            _regions['province'] = CategoricalColumn.full(first.size, 'N/A')
+        _timeseries = {key : self.get_group_totals(value, grouping) for key, value in timeseries.items()}
+        self._rollups[level] = {'grouping' : grouping, 'regions' : _regions, 'timeseries' : _timeseries, 'searcher' : Searcher(_regions, indexed=True, coordinates=('longitude', 'latitude'))}
+
+    def update_rollups(self, nappended):
+        """
+
+        """
+        for level in ('province', 'country'):
+            if level not in self._rollups:
+                continue
+            rollup = self._rollups[level]
+            if level == 'province':
+                timeseries = {'confirmed' : self.confirmed, 'dead' : self.dead, 'recovered' : self.recovered}
+            else:
+                timeseries = self._rollups['province']['timeseries']
+            for key, value in timeseries.items():
+                columns = self.get_group_totals(value[:, -nappended:], rollup['grouping'])
+                buffer_key = '{} {}'.format(level, key)
+                rollup['timeseries'][key], self._buffers[buffer_key] = self.append_columns(rollup['timeseries'][key], columns, self._buffers.get(buffer_key))
 
-    def combine_data(self, regions, timeseries):
+    def select_window(self, window=None, timeseries=None, direction='nearest'):
         """
 
         """
-        _regions = {key : [] for key in list(self.regions.keys())}
-        _timeseries = {key : [] for key in list(self.timeseries.keys())}
-        for region in regions:
-            for key, value in region.items():
-                _regions[key].extend(value.tolist())
-        for series in timeseries:
-            for key, value in series.items():
-                _timeseries[key].extend(value.tolist())
-        _regions = {key : np.array(value) for key, value in _regions.items()}
-        _timeseries = {key : np.array(value) for key, value in _timeseries.items()}
+        columns = self.get_window(window, direction)
+        if timeseries is None:
+            timeseries = self.timeseries
+        ## column slices are views of the case matrices
+        return self.x[columns], {key : value[:, columns] for key, value in timeseries.items()}
+
+    def get_plotted_window(self, x, timeseries, window=None, direction='nearest'):
+        """
+
+        """
+        if x is None:
+            ncolumns = set(np.shape(value)[1] for value in timeseries.values())
+            if ncolumns != {self.x.size}:
+                raise ValueError("timeseries of {} dates need the dates x returned by select_window".format(sorted(ncolumns)))
+            return self.select_window(window, timeseries, direction)
+        x = np.asarray(x)
+        if any(np.shape(value)[1] != x.size for value in timeseries.values()):
+            raise ValueError("{} dates for timeseries of {} dates".format(x.size, [np.shape(value)[1] for value in timeseries.values()]))
+        if window is None:
+            return x, timeseries
+        ## the window is found among all dates and then restricted to the given dates
+        dates = self.x[self.get_window(window, direction)]
+        columns = slice(int(np.searchsorted(x, dates[0], side='left')), int(np.searchsorted(x, dates[-1], side='right')))
+        if len(range(*columns.indices(x.size))) == 0:
+            raise ValueError("no dates found in window: {}".format(window))
+        return x[columns], {key : value[:, columns] for key, value in timeseries.items()}
+
+    def get_rollup(self, level='country'):
+        """
+
+        """
+        if level not in self._rollups:
+            self.load_rollups(level)
+        rollup = self._rollups[level]
+        return rollup['regions'], rollup['timeseries']
+
+    def select_rollups(self, level='country', parameters=None, conditions=None, values=None, apply_to='all', modifiers=None):
+        """
+
+        """
+        regions, timeseries = self.get_rollup(level)
+        S = self._rollups[level]['searcher']
+        indices = S.search_indices(parameters, conditions, values, apply_to, modifiers, axis=0)
+        regions = {key : value[indices] for key, value in regions.items()}
+        timeseries = {key : value[indices] for key, value in timeseries.items()}
+        return regions, timeseries
+
+    @staticmethod
+    def get_region_keys(regions):
+        """
+
+        """
+        data = np.array([regions['country'], regions['province'], regions['county'], np.asarray(regions['longitude']).astype(str), np.asarray(regions['latitude']).astype(str)]).T
+        return DataBase.get_row_keys(data, (0, 1, 2, 3, 4))
+
+    def get_row_indices(self, regions):
+        """
+
+        """
+        if self._row_keys is None:
+            keys = self.get_region_keys(self.regions)
+            order = np.argsort(keys)
+            self._row_keys = (keys[order], order)
+        keys, order = self._row_keys
+        _keys = self.get_region_keys(regions)
+        positions = np.minimum(np.searchsorted(keys, _keys), keys.size - 1)
+        if not np.all(keys[positions] == _keys):
+            raise ValueError("regions are not rows of this DataBase")
+        return order[positions]
+
+    def combine_data(self, regions, timeseries, unique=True, indices=False):
+        """
+
+        """
+        if len(regions) == 0:
+            _regions = {key : value[:0] for key, value in self.regions.items()}
+            _timeseries = {key : value[:0] for key, value in self.timeseries.items()}
+        else:
+            _regions = {key : self.get_concatenated_arrays([region[key] for region in regions]) for key in regions[0].keys()}
+            _timeseries = {key : self.get_concatenated_arrays([series[key] for series in timeseries], axis=0) for key in timeseries[0].keys()}
+        if indices:
+            ## rows of the shared base arrays in place of copies
+            _indices = self.get_row_indices(_regions)
+            if unique:
+                _, first = np.unique(_indices, return_index=True)
+                _indices = _indices[np.sort(first)]
+            return _indices
+        if unique:
+            ## overlapping selections keep the first occurrence of each region
+            _, first = np.unique(self.get_region_keys(_regions), return_index=True)
+            if first.size < _regions['country'].size:
+                first = np.sort(first)
+                _regions = {key : value[first] for key, value in _regions.items()}
+                _timeseries = {key : value[first] for key, value in _timeseries.items()}
         return _regions, _timeseries
 
-    def view_case_comparisons_per_location(self, regions, timeseries, scale='linear', xmajor='month', xminor='day', xfmt="%Y-%m-%d", xrotation=15, facecolors='rgb', save=False, **kwargs):
+    def get_case_comparison_savename(self, country, province, county, scale):
+        """
+
+        """
+        title = self.get_region_name(country, province, county)
+        return 'per_{}'.format(title.title().replace(' ', '')) + '__{}'.format(scale)
+
+    def view_case_comparisons_per_location(self, regions, timeseries, scale='linear', xmajor='month', xminor='day', xfmt="%Y-%m-%d", xrotation=15, facecolors='rgb', save=False, lod=None, resolution='publication', window=None, x=None, **kwargs):
         """
 
         """
         nc = len(facecolors)
         if nc != 3:
             raise ValueError("invalid number of facecolors: {}".format(nc))
-        alpha = 1/nc
+        x, timeseries = self.get_plotted_window(x, {key : timeseries[key] for key in ('confirmed', 'dead', 'recovered')}, window)
+        suffix = self.get_consolidated_file_timestamps(max_seconds=120)
+        dpi = self.get_resolution(resolution)
+        template = None
         for country, province, county, confirmed, dead, recovered in zip(regions['country'], regions['province'], regions['county'], timeseries['confirmed'], timeseries['dead'], timeseries['recovered']):
-            fig, ax = plt.subplots(**kwargs)
             title = self.get_region_name(country, province, county)
-            for y, label, facecolor, linestyle in zip((confirmed, dead, recovered), ('Confirmed', 'Dead', 'Recovered'), facecolors, ('-', '-.', '--')):
-                condition = (y > 0)
-                if scale == 'linear':
-                    ax.plot(self.x[condition], y[condition], color=facecolor, label=label, alpha=alpha, linestyle=linestyle)
-                else:
-                    # ax.semilogy(self.x[condition], y[condition], color=facecolor, label=label, alpha=alpha, linestyle=linestyle)
-                    ax.plot(self.x[condition], y[condition], color=facecolor, label=label, alpha=alpha, linestyle=linestyle)
-            ax = self.transform_x_as_datetime(ax, xmajor, xminor, xfmt, xrotation)
-            ax.set_xlabel('Date', fontsize=self.labelsize)
-            ax.set_ylabel('Frequency of Cases', fontsize=self.labelsize)
-            ax = self.update_y_scaling(ax, scale)
-            ax.tick_params(axis='both', which='both', labelsize=self.ticksize)
-            ax.grid(color='k', linestyle=':', alpha=0.3)
-            ax.set_xlim([self.x[0], self.x[-1]])
-            ax.set_title(title, fontsize=self.titlesize)
-            handles, labels = ax.get_legend_handles_labels()
-            handles, labels, ncol = self.autocorrect_legend_entries(ax, handles, labels)
-            suffix = self.get_consolidated_file_timestamps(max_seconds=120)
-            kws = dict(handles=handles, labels=labels, ncol=ncol, mode='expand', loc='lower center', fontsize=self.labelsize, borderaxespad=0.1)
-            fig.subplots_adjust(bottom=0.325)
-            leg = fig.legend(**kws)
-            leg = self.update_legend_design(leg, title='Cases via CSSEGIS/JHU ({})'.format(suffix), textcolor='darkorange', facecolor='k', edgecolor='steelblue')
             if save:
-                savename = 'per_{}'.format(title.title().replace(' ', '')) + '__{}'.format(scale)
+                savename = self.get_case_comparison_savename(country, province, county, scale)
+                fingerprint = self.get_render_fingerprint(x, confirmed, dead, recovered, title, suffix, scale, xmajor, xminor, xfmt, xrotation, facecolors, lod, kwargs)
+                if self.is_image_current(savename, fingerprint, dpi=dpi):
+                    continue
+                ## saved figures share one figure whose line data are swapped per location
+                if template is None:
+                    template = self.get_case_comparison_template(x, suffix, scale, xmajor, xminor, xfmt, xrotation, facecolors, lod, dpi, **kwargs)
+                fig = self.update_case_comparison_template(template, title, (confirmed, dead, recovered))
+                self.display_image(fig, savename, dpi=dpi, fingerprint=fingerprint, close=False)
             else:
-                savename = None
-            self.display_image(fig, savename)
+                fig = self.get_case_comparison_figure(x, title, (confirmed, dead, recovered), suffix, scale, xmajor, xminor, xfmt, xrotation, facecolors, lod, dpi, **kwargs)
+                self.display_image(fig, None)
+        if template is not None:
+            plt.close(template['fig'])
 
-    def view_case_comparisons_by_location(self, regions, timeseries, scale='linear', xmajor='month', xminor='day', xfmt="%Y-%m-%d", xrotation=15, cmap='jet_r', linestyles=(['-', ':']), save=False, **kwargs):
+    def render_case_comparisons_per_location(self, regions, timeseries, scale='linear', xmajor='month', xminor='day', xfmt="%Y-%m-%d", xrotation=15, facecolors='rgb', nworkers=None, chunksize=4, lod=None, resolution='publication', window=None, x=None, **kwargs):
+        """
+
+        """
+        nc = len(facecolors)
+        if nc != 3:
+            raise ValueError("invalid number of facecolors: {}".format(nc))
+        x, timeseries = self.get_plotted_window(x, {key : timeseries[key] for key in ('confirmed', 'dead', 'recovered')}, window)
+        suffix = self.get_consolidated_file_timestamps(max_seconds=120)
+        dpi = self.get_resolution(resolution)
+        tasks, manifest = [], []
+        for country, province, county, confirmed, dead, recovered in zip(regions['country'], regions['province'], regions['county'], timeseries['confirmed'], timeseries['dead'], timeseries['recovered']):
+            title = self.get_region_name(country, province, county)
+            savename = self.get_case_comparison_savename(country, province, county, scale)
+            fingerprint = self.get_render_fingerprint(x, confirmed, dead, recovered, title, suffix, scale, xmajor, xminor, xfmt, xrotation, facecolors, lod, kwargs)
+            if self.is_image_current(savename, fingerprint, dpi=dpi):
+                manifest.append({'title' : title, 'path' : self.get_image_path(savename), 'seconds' : 0.0, 'error' : None, 'skipped' : True})
+            else:
+                tasks.append((title, savename, fingerprint, np.array(confirmed), np.array(dead), np.array(recovered)))
+        if len(tasks) == 0:
+            return manifest
+        if nworkers is None:
+            nworkers = os.cpu_count() or 1
+        nworkers = max(1, min(nworkers, len(tasks)))
+        settings = dict(directory=self.directory, ticksize=self.ticksize, labelsize=self.labelsize, textsize=self.textsize, titlesize=self.titlesize, headersize=self.headersize, cellsize=self.cellsize)
+        plot_kwargs = dict(suffix=suffix, scale=scale, xmajor=xmajor, xminor=xminor, xfmt=xfmt, xrotation=xrotation, facecolors=facecolors, lod=lod, resolution=dpi, **kwargs)
+        with ProcessPoolExecutor(max_workers=nworkers, initializer=initialize_render_worker, initargs=(settings, x, plot_kwargs, self.is_render_cached)) as executor:
+            manifest.extend(executor.map(render_case_comparison_figure, tasks, chunksize=chunksize))
+        return manifest
+
+    def view_case_comparisons_by_location(self, regions, timeseries, scale='linear', xmajor='month', xminor='day', xfmt="%Y-%m-%d", xrotation=15, cmap='jet_r', linestyles=(['-', ':']), save=False, collection=False, lod=None, resolution='publication', window=None, x=None, **kwargs):
         """
 
         """
         norm = Normalize(vmin=0, vmax=regions['province'].size)
         vector = np.arange(regions['province'].size).astype(int)
         facecolors = self.get_facecolors_from_cmap(cmap, norm, vector)
-        linestyles = self.generate_linestyle_cycle(linestyles)
+        linestyle_cycle = self.generate_linestyle_cycle(linestyles)
         alpha = self.autocorrect_transparency(1/vector.size)
-        location_labels = []
+        location_labels = [self.get_region_name(country, province, county) for country, province, county in zip(regions['country'], regions['province'], regions['county'])]
+        x, timeseries = self.get_plotted_window(x, {key : timeseries[key] for key in ('confirmed', 'dead', 'recovered')}, window)
+        suffix = self.get_consolidated_file_timestamps(max_seconds=120)
+        dpi = self.get_resolution(resolution)
+        lod = self.autocorrect_lod(lod)
+        fingerprint = None
+        if save:
+            savename = "_".join(sorted(location_labels)).title().replace(' ', '') + '__{}'.format(scale)
+            fingerprint = self.get_render_fingerprint(x, timeseries['confirmed'], timeseries['dead'], timeseries['recovered'], location_labels, suffix, scale, xmajor, xminor, xfmt, xrotation, cmap, linestyles, collection, lod, kwargs)
+            if self.is_image_current(savename, fingerprint, dpi=dpi):
+                return
+        else:
+            savename = None
         fig, axes = plt.subplots(nrows=4, ncols=1, **kwargs)
         axes[-1].axis('off')
-        for country, province, county, confirmed, dead, recovered, facecolor in zip(regions['country'], regions['province'], regions['county'], timeseries['confirmed'], timeseries['dead'], timeseries['recovered'], facecolors):
-            location_label = self.get_region_name(country, province, county)
-            location_labels.append(location_label)
-            linestyle = next(linestyles)
-            for i, (ax, y) in enumerate(zip(axes.ravel(), (confirmed, dead, recovered))):
-                condition = (y > 0)
-                label = location_label if i == 0 else None
-                if scale == 'linear':
-                    ax.plot(self.x[condition], y[condition], color=facecolor, alpha=alpha, linestyle=linestyle, label=label)
-                else:
-                    # ax.semilogy(self.x[condition], y[condition], color=facecolor, alpha=alpha, linestyle=linestyle, label=label)
-                    ax.plot(self.x[condition], y[condition], color=facecolor, alpha=alpha, linestyle=linestyle, label=label)
+        npixels = self.get_axes_pixel_width(axes[0], dpi) if lod is not None else None
+        if collection:
+            ## one LineCollection per panel instead of one Line2D per region
+            _linestyles = [next(linestyle_cycle) for location_label in location_labels]
+            for ax, y in zip(axes.ravel(), (timeseries['confirmed'], timeseries['dead'], timeseries['recovered'])):
+                self.add_line_collection(ax, x, y, facecolors, _linestyles, alpha, npixels, lod)
+            handles, labels = self.get_line_proxies(facecolors, _linestyles, alpha), location_labels
+        else:
+            for location_label, confirmed, dead, recovered, facecolor in zip(location_labels, timeseries['confirmed'], timeseries['dead'], timeseries['recovered'], facecolors):
+                linestyle = next(linestyle_cycle)
+                for i, (ax, y) in enumerate(zip(axes.ravel(), (confirmed, dead, recovered))):
+                    condition = (y > 0)
+                    label = location_label if i == 0 else None
+                    xs, ys = x[condition], y[condition]
+                    if lod is not None:
+                        indices = self.get_decimation_indices(ys, npixels, lod)
+                        xs, ys = xs[indices], ys[indices]
+                    if scale == 'linear':
+                        ax.plot(xs, ys, color=facecolor, alpha=alpha, linestyle=linestyle, label=label)
+                    else:
+                        # ax.semilogy(xs, ys, color=facecolor, alpha=alpha, linestyle=linestyle, label=label)
+                        ax.plot(xs, ys, color=facecolor, alpha=alpha, linestyle=linestyle, label=label)
+            handles, labels = axes[0].get_legend_handles_labels()
         for i, (ax, title) in enumerate(zip(axes[:-1].ravel(), ('Confirmed', 'Dead', 'Recovered'))):
             ax = self.transform_x_as_datetime(ax, xmajor, xminor, xfmt, xrotation)
             if i in (0, 1):
@@ -338,22 +1061,17 @@ class DataBase(VisualConfiguration):
             ax = self.update_y_scaling(ax, scale)
             ax.tick_params(axis='both', which='both', labelsize=self.ticksize)
             ax.grid(color='k', linestyle=':', alpha=0.3)
-            ax.set_xlim([self.x[0], self.x[-1]])
+            ax.set_xlim([x[0], x[-1]])
             ax.set_title(title, fontsize=self.titlesize)
         axes[2].set_xlabel('Date', fontsize=self.labelsize)
         axes[1].set_ylabel('Frequency of Cases', fontsize=self.labelsize)
-        handles, labels, ncol = self.autocorrect_legend_entries(axes[-1], *axes[0].get_legend_handles_labels())
-        suffix = self.get_consolidated_file_timestamps(max_seconds=120)
+        handles, labels, ncol = self.autocorrect_legend_entries(axes[-1], handles, labels)
         kws = dict(handles=handles, labels=labels, ncol=ncol, mode='expand', loc='lower center', fontsize=self.labelsize, borderaxespad=0.1)
         fig.subplots_adjust(hspace=0.375)
         leg = fig.legend(**kws)
         leg = self.update_legend_design(leg, title='Cases via CSSEGIS/JHU ({})'.format(suffix), textcolor='darkorange', facecolor='k', edgecolor='steelblue')
         fig.align_ylabels()
-        if save:
-            savename = "_".join(sorted(location_labels)).title().replace(' ', '') + '__{}'.format(scale)
-        else:
-            savename = None
-        self.display_image(fig, savename)
+        self.display_image(fig, savename, dpi=dpi, fingerprint=fingerprint)
         # try:
         #     self.display_image(fig, savename)
         # except OSError as e:
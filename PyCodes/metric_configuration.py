@@ -0,0 +1,93 @@
+import numpy as np
+from compact_configuration import CompactConfiguration
+
+class MetricConfiguration():
+
+    def __init__(self, window=7):
+        super().__init__()
+        if window < 1:
+            raise ValueError("invalid window: {}".format(window))
+        self.window = window
+        self.cases = ('confirmed', 'dead', 'recovered')
+        self.keys = ('new confirmed', 'new dead', 'new recovered', 'active', 'growth factor', 'doubling time', 'average new confirmed', 'average new dead', 'average new recovered')
+
+    @property
+    def lookback(self):
+        ## number of previous dates that the latest value of every metric depends on
+        return self.window + 1
+
+    @staticmethod
+    def get_daily_change(matrix):
+        """
+
+        """
+        daily = np.empty(matrix.shape, dtype=float)
+        daily[:, 0] = matrix[:, 0]
+        np.subtract(matrix[:, 1:], matrix[:, :-1], out=daily[:, 1:])
+        return daily
+
+    @staticmethod
+    def get_ratio(numerator, denominator):
+        """
+
+        """
+        ratio = np.full(numerator.shape, np.nan)
+        np.divide(numerator, denominator, out=ratio, where=(denominator != 0))
+        return ratio
+
+    def get_growth_factor(self, daily):
+        """
+
+        """
+        growth = np.full(daily.shape, np.nan)
+        growth[:, 1:] = self.get_ratio(daily[:, 1:], daily[:, :-1])
+        return growth
+
+    def get_doubling_time(self, matrix):
+        """
+
+        """
+        w = self.window
+        doubling = np.full(matrix.shape, np.nan)
+        if matrix.shape[1] > w:
+            ratio = self.get_ratio(matrix[:, w:], matrix[:, :-w])
+            is_growing = (ratio > 1)
+            logs = np.log(ratio, out=np.full(ratio.shape, np.nan), where=is_growing)
+            np.divide(w * np.log(2), logs, out=doubling[:, w:], where=is_growing)
+        return doubling
+
+    def get_rolling_mean(self, matrix):
+        """
+
+        """
+        w = self.window
+        nrows, ncols = matrix.shape
+        rolling = np.full(matrix.shape, np.nan)
+        if ncols >= w:
+            is_finite = np.isfinite(matrix)
+            sums = np.zeros((nrows, ncols + 1))
+            counts = np.zeros((nrows, ncols + 1))
+            np.cumsum(np.where(is_finite, matrix, 0), axis=1, out=sums[:, 1:])
+            np.cumsum(is_finite, axis=1, out=counts[:, 1:])
+            rolling[:, w - 1:] = self.get_ratio(sums[:, w:] - sums[:, :-w], counts[:, w:] - counts[:, :-w])
+        return rolling
+
+    def get_metrics(self, confirmed, dead, recovered, start=0):
+        """
+
+        """
+        ## only the dates that the requested columns depend on are read
+        lower = max(0, start - self.lookback)
+        ## compact (integer) matrices are read as floats with NaN in their missing cells
+        cases = {key : CompactConfiguration.get_float_matrix(matrix[:, lower:]) for key, matrix in zip(self.cases, (confirmed, dead, recovered))}
+        metrics = dict()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for key in self.cases:
+                metrics['new {}'.format(key)] = self.get_daily_change(cases[key])
+            metrics['active'] = cases['confirmed'] - cases['dead'] - cases['recovered']
+            metrics['growth factor'] = self.get_growth_factor(metrics['new confirmed'])
+            metrics['doubling time'] = self.get_doubling_time(cases['confirmed'])
+            for key in self.cases:
+                metrics['average new {}'.format(key)] = self.get_rolling_mean(metrics['new {}'.format(key)])
+        offset = start - lower
+        return {key : metrics[key][:, offset:] for key in self.keys}
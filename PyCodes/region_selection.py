@@ -0,0 +1,196 @@
+import numpy as np
+from collections.abc import Mapping
+from categorical_column import CategoricalColumn
+
+class RowView(np.lib.mixins.NDArrayOperatorsMixin):
+
+    def __init__(self, data, rows):
+        super().__init__()
+        ## rows of data that are only copied when the whole selection is converted to an array
+        self.data = data
+        self.rows = np.asarray(rows)
+
+    @property
+    def shape(self):
+        return (self.rows.size,) + np.shape(self.data)[1:]
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.rows.size
+
+    def __iter__(self):
+        ## each row is a view of data
+        for row in self.rows:
+            yield self.data[row]
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        rows = self.rows[index[0]]
+        data = self.data[(slice(None),) + index[1:]] if len(index) > 1 else self.data
+        if np.ndim(rows) == 0:
+            return data[rows]
+        return RowView(data, rows)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.data[self.rows]
+        return values if dtype is None else values.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = tuple(np.asarray(value) if isinstance(value, RowView) else value for value in inputs)
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getattr__(self, name):
+        ## other array methods (such as max) are applied to a copy of the rows
+        if name.startswith('_') or (name in ('data', 'rows')):
+            raise AttributeError(name)
+        return getattr(np.asarray(self), name)
+
+    def __repr__(self):
+        return '{}(shape={}, dtype={})'.format(type(self).__name__, self.shape, self.dtype)
+
+class SelectionMapping(Mapping):
+
+    def __init__(self, loader, indices, view=False):
+        super().__init__()
+        self.loader = loader
+        self.indices = indices
+        self.view = view
+        self.columns = dict()
+
+    def __getitem__(self, key):
+        if key not in self.columns:
+            value = self.loader()[key]
+            if self.view and not isinstance(self.indices, slice):
+                self.columns[key] = RowView(value, self.indices)
+            else:
+                self.columns[key] = value[self.indices]
+        return self.columns[key]
+
+    def __iter__(self):
+        return iter(self.loader())
+
+    def __len__(self):
+        return len(self.loader())
+
+class RegionSelection():
+
+    def __init__(self, database, indices):
+        super().__init__()
+        self.database = database
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        self.indices = indices.astype(int)
+        ## evenly spaced rows are read through a slice, which is a view rather than a copy
+        rows = database.get_row_slice(self.indices)
+        self.regions = SelectionMapping(lambda : self.database.regions, rows)
+        ## rows of memory-mapped matrices are read through views rather than copied
+        self.timeseries = SelectionMapping(lambda : self.database.timeseries, rows, view=(database.storage == 'mmap'))
+
+    def __len__(self):
+        return self.indices.size
+
+    def __iter__(self):
+        regions, timeseries = self.database.regions, self.database.timeseries
+        for index in self.indices:
+            region = {key : value[index] for key, value in regions.items()}
+            series = {key : value[index] for key, value in timeseries.items()}
+            yield region, series
+
+    def __repr__(self):
+        return '{}(nregions={})'.format(type(self).__name__, self.indices.size)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def autocorrect_other(self, other):
+        """
+
+        """
+        if not isinstance(other, RegionSelection):
+            raise ValueError("invalid type(other): {}".format(type(other)))
+        if other.database is not self.database:
+            raise ValueError("selections of different databases cannot be combined")
+        return other
+
+    def get_row_mask(self, indices):
+        """
+
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            return indices
+        mask = np.zeros(self.database.countries.size, dtype=bool)
+        mask[indices] = True
+        return mask
+
+    def filter(self, indices):
+        """
+
+        """
+        ## keeps the order of this selection
+        return RegionSelection(self.database, self.indices[self.get_row_mask(indices)[self.indices]])
+
+    def union(self, other):
+        """
+
+        """
+        other = self.autocorrect_other(other)
+        is_new = np.invert(self.get_row_mask(self.indices)[other.indices])
+        return RegionSelection(self.database, np.concatenate((self.indices, other.indices[is_new])))
+
+    def intersection(self, other):
+        """
+
+        """
+        other = self.autocorrect_other(other)
+        return self.filter(other.indices)
+
+    def difference(self, other):
+        """
+
+        """
+        other = self.autocorrect_other(other)
+        return self.filter(np.invert(self.get_row_mask(other.indices)))
+
+    def select_regions(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None):
+        """
+
+        """
+        S = self.database.searchers['region']
+        indices = S.search_indices(parameters, conditions, values, apply_to, modifiers, axis=0)
+        return self.filter(indices)
+
+    def select_timeseries(self, parameters=None, conditions=None, values=None, apply_to='all', modifiers=None, reducers=None):
+        """
+
+        """
+        S = self.database.searchers['timeseries']
+        indices = S.search_indices(parameters, conditions, values, apply_to, modifiers, axis=0, reducers=reducers)
+        return self.filter(indices)
+
+    def materialize(self):
+        """
+
+        """
+        regions = {key : value.copy() if isinstance(value, CategoricalColumn) else np.array(value) for key, value in self.regions.items()}
+        timeseries = {key : np.array(value) for key, value in self.timeseries.items()}
+        return regions, timeseries
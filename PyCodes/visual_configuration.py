@@ -1,9 +1,22 @@
 import numpy as np
 import itertools
+import os
+import time
+import hashlib
+import traceback
+import io
 import matplotlib.pyplot as plt
 from matplotlib.dates import date2num, YearLocator, MonthLocator, DayLocator, DateFormatter
 import matplotlib.ticker as ticker
 from matplotlib.colors import Normalize, LogNorm
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from matplotlib.transforms import Bbox
+from compact_configuration import CompactConfiguration
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 class CustomTicker(ticker.LogFormatterSciNotation):
 
@@ -29,6 +42,8 @@ class VisualConfiguration():
         self.cellsize = cellsize
         self.empty_label = '  '
         self.locators = {'year' : YearLocator, 'month' : MonthLocator, 'day' : DayLocator}
+        self.is_render_cached = True
+        self.resolutions = {'preview' : 100, 'publication' : 800}
 
     @staticmethod
     def generate_linestyle_cycle(linestyles):
@@ -63,6 +78,136 @@ class VisualConfiguration():
         facecolors = _cmap(norm(vector))
         return facecolors
 
+    def get_resolution(self, resolution):
+        """
+
+        """
+        if isinstance(resolution, str):
+            if resolution not in self.resolutions:
+                raise ValueError("invalid resolution: {}".format(resolution))
+            return self.resolutions[resolution]
+        return resolution
+
+    @staticmethod
+    def get_axes_pixel_width(ax, dpi):
+        """
+
+        """
+        return int(np.ceil(ax.get_position().width * ax.get_figure().get_figwidth() * dpi))
+
+    @staticmethod
+    def get_minmax_indices(y, nbins):
+        """
+
+        """
+        m, n = y.shape
+        width = int(np.ceil(n / nbins))
+        nbins = int(np.ceil(n / width))
+        padded = np.full((m, nbins * width), np.nan)
+        padded[:, :n] = y
+        padded = padded.reshape((m, nbins, width))
+        is_missing = np.isnan(padded)
+        offsets = np.arange(nbins) * width
+        lower = np.argmin(np.where(is_missing, np.inf, padded), axis=-1) + offsets
+        upper = np.argmax(np.where(is_missing, -np.inf, padded), axis=-1) + offsets
+        ends = np.zeros((m, 1), dtype=int)
+        indices = np.concatenate((ends, lower, upper, ends + n - 1), axis=1)
+        return np.sort(np.minimum(indices, n - 1), axis=1)
+
+    @staticmethod
+    def get_lttb_indices(y, npoints):
+        """
+        https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf
+        """
+        m, n = y.shape
+        rows = np.arange(m)
+        edges = np.linspace(1, n - 1, npoints - 1).astype(int)
+        indices = np.empty((m, npoints), dtype=int)
+        indices[:, 0], indices[:, -1] = 0, n - 1
+        selected = indices[:, 0]
+        for i in range(npoints - 2):
+            start, stop = edges[i], edges[i + 1]
+            next_start = stop
+            next_stop = edges[i + 2] if i + 2 < edges.size else n
+            following = y[:, next_start:next_stop]
+            counts = np.sum(np.isfinite(following), axis=1)
+            yc = np.divide(np.nansum(following, axis=1), counts, out=np.full(m, np.nan), where=(counts > 0))
+            xc = (next_start + next_stop - 1) / 2
+            xa, ya = selected[:, np.newaxis], y[rows, selected][:, np.newaxis]
+            xs, ys = np.arange(start, stop), y[:, start:stop]
+            area = np.abs((xa - xc) * (ys - ya) - (xa - xs) * (yc[:, np.newaxis] - ya))
+            area[np.isnan(area)] = -1
+            selected = start + np.argmax(area, axis=1)
+            indices[:, i + 1] = selected
+        return indices
+
+    @staticmethod
+    def get_decimation_indices(y, npixels, lod='minmax'):
+        """
+
+        """
+        y = np.asarray(y, dtype=float)
+        is_vector = (y.ndim == 1)
+        if is_vector:
+            y = y.reshape((1, -1))
+        n = y.shape[1]
+        ## two points per pixel column already resolve every extremum
+        if n <= 2 * npixels:
+            indices = np.broadcast_to(np.arange(n), y.shape)
+        elif lod == 'minmax':
+            indices = VisualConfiguration.get_minmax_indices(y, npixels)
+        elif lod == 'lttb':
+            indices = VisualConfiguration.get_lttb_indices(y, 2 * npixels)
+        else:
+            raise ValueError("invalid lod: {}".format(lod))
+        if is_vector:
+            return indices[0]
+        return indices
+
+    @staticmethod
+    def autocorrect_lod(lod):
+        """
+
+        """
+        if lod is None or lod is False:
+            return None
+        if lod is True:
+            return 'minmax'
+        if lod not in ('minmax', 'lttb'):
+            raise ValueError("invalid lod: {}".format(lod))
+        return lod
+
+    @staticmethod
+    def add_line_collection(ax, x, y, facecolors, linestyles, alpha=None, npixels=None, lod=None):
+        """
+
+        """
+        x = date2num(x)
+        ## non-positive or missing values become gaps in the lines
+        y = CompactConfiguration.get_float_matrix(y)
+        y = np.where(y > 0, y, np.nan)
+        if lod is not None:
+            indices = VisualConfiguration.get_decimation_indices(y, npixels, lod)
+            x, y = x[indices], np.take_along_axis(y, indices, axis=1)
+        segments = np.empty(y.shape + (2,), dtype=float)
+        segments[:, :, 0] = x
+        segments[:, :, 1] = y
+        lc = LineCollection(segments, colors=facecolors, linestyles=linestyles, alpha=alpha)
+        ax.add_collection(lc, autolim=False)
+        ax.xaxis_date()
+        is_finite = np.isfinite(segments[:, :, 1])
+        if np.any(is_finite):
+            ax.update_datalim(segments[is_finite])
+        ax.autoscale_view()
+        return lc
+
+    @staticmethod
+    def get_line_proxies(facecolors, linestyles, alpha=None):
+        """
+
+        """
+        return [Line2D([], [], color=facecolor, linestyle=linestyle, alpha=alpha) for facecolor, linestyle in zip(facecolors, linestyles)]
+
     @staticmethod
     def update_y_scaling(ax, scale):
         """
@@ -132,15 +277,328 @@ class VisualConfiguration():
                 text.set_color(textcolor)
         return leg
 
-    def display_image(self, fig, savename=None, dpi=800, bbox_inches='tight', pad_inches=0.1, extension='.png', **kwargs):
+    def get_case_comparison_template(self, x, suffix, scale='linear', xmajor='month', xminor='day', xfmt="%Y-%m-%d", xrotation=15, facecolors='rgb', lod=None, resolution='publication', **kwargs):
+        """
+
+        """
+        alpha = 1/len(facecolors)
+        fig, ax = plt.subplots(**kwargs)
+        lines = []
+        for label, facecolor, linestyle in zip(('Confirmed', 'Dead', 'Recovered'), facecolors, ('-', '-.', '--')):
+            ## start from an all-NaN line so that the datetime units of x are registered once
+            line, = ax.plot(x, np.full(len(x), np.nan), color=facecolor, label=label, alpha=alpha, linestyle=linestyle)
+            lines.append(line)
+        ax = self.transform_x_as_datetime(ax, xmajor, xminor, xfmt, xrotation)
+        ax.set_xlabel('Date', fontsize=self.labelsize)
+        ax.set_ylabel('Frequency of Cases', fontsize=self.labelsize)
+        ax = self.update_y_scaling(ax, scale)
+        ax.tick_params(axis='both', which='both', labelsize=self.ticksize)
+        ax.grid(color='k', linestyle=':', alpha=0.3)
+        ax.set_xlim([x[0], x[-1]])
+        handles, labels = ax.get_legend_handles_labels()
+        handles, labels, ncol = self.autocorrect_legend_entries(ax, handles, labels)
+        kws = dict(handles=handles, labels=labels, ncol=ncol, mode='expand', loc='lower center', fontsize=self.labelsize, borderaxespad=0.1)
+        fig.subplots_adjust(bottom=0.325)
+        leg = fig.legend(**kws)
+        leg = self.update_legend_design(leg, title='Cases via CSSEGIS/JHU ({})'.format(suffix), textcolor='darkorange', facecolor='k', edgecolor='steelblue')
+        dpi = self.get_resolution(resolution)
+        lod = self.autocorrect_lod(lod)
+        npixels = self.get_axes_pixel_width(ax, dpi) if lod is not None else None
+        ## the date units are registered by now, so lines are updated with day numbers that need no conversion
+        return {'fig' : fig, 'ax' : ax, 'lines' : lines, 'x' : date2num(x), 'dpi' : dpi, 'lod' : lod, 'npixels' : npixels, 'ylim' : ax.get_ylim()}
+
+    def update_case_comparison_template(self, template, title, series):
+        """
+
+        """
+        x, ax = template['x'], template['ax']
+        is_empty = True
+        for line, y in zip(template['lines'], series):
+            condition = (y > 0)
+            xs, ys = x[condition], y[condition]
+            if template['lod'] is not None:
+                indices = self.get_decimation_indices(ys, template['npixels'], template['lod'])
+                xs, ys = xs[indices], ys[indices]
+            line.set_data(xs, ys)
+            is_empty = is_empty and (np.count_nonzero(np.isfinite(ys)) == 0)
+        ax.set_title(title, fontsize=self.titlesize)
+        if is_empty:
+            ## without data, autoscaling would keep the limits of the previous series
+            ax.set_ylim(template['ylim'], auto=True)
+        else:
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+        return template['fig']
+
+    def get_case_comparison_figure(self, x, title, series, suffix, scale='linear', xmajor='month', xminor='day', xfmt="%Y-%m-%d", xrotation=15, facecolors='rgb', lod=None, resolution='publication', **kwargs):
+        """
+
+        """
+        template = self.get_case_comparison_template(x, suffix, scale, xmajor, xminor, xfmt, xrotation, facecolors, lod, resolution, **kwargs)
+        return self.update_case_comparison_template(template, title, series)
+
+    @staticmethod
+    def update_render_fingerprint(h, arg):
+        """
+
+        """
+        if isinstance(arg, np.ndarray):
+            if arg.dtype == object:
+                h.update(repr(arg.tolist()).encode())
+            else:
+                h.update('{}{}'.format(arg.dtype.str, arg.shape).encode())
+                h.update(np.ascontiguousarray(arg).tobytes())
+        elif isinstance(arg, dict):
+            for key in sorted(arg.keys()):
+                h.update(repr(key).encode())
+                VisualConfiguration.update_render_fingerprint(h, arg[key])
+        elif hasattr(arg, 'rows') and hasattr(arg, '__array__'):
+            ## row views are hashed like the array of their rows
+            VisualConfiguration.update_render_fingerprint(h, np.asarray(arg))
+        elif isinstance(arg, (tuple, list)):
+            h.update('{}{}'.format(type(arg).__name__, len(arg)).encode())
+            for _arg in arg:
+                VisualConfiguration.update_render_fingerprint(h, _arg)
+        else:
+            h.update(repr(arg).encode())
+
+    def get_render_fingerprint(self, *args):
+        """
+
+        """
+        h = hashlib.sha1()
+        for arg in args + (self.ticksize, self.labelsize, self.textsize, self.titlesize, self.headersize, self.cellsize):
+            self.update_render_fingerprint(h, arg)
+        return h.hexdigest()
+
+    def get_image_path(self, savename, extension='.png'):
+        """
+
+        """
+        return '{}Figures/{}{}'.format(self.directory, savename, extension)
+
+    def get_fingerprint_path(self, savename, extension='.png'):
+        """
+
+        """
+        return '{}Figures/.fingerprints/{}{}.sha1'.format(self.directory, savename, extension)
+
+    def get_image_fingerprint(self, fingerprint, dpi=800, bbox_inches='tight', pad_inches=0.1, extension='.png', **kwargs):
+        """
+
+        """
+        return self.get_render_fingerprint(fingerprint, dpi, bbox_inches, pad_inches, extension, kwargs)
+
+    def is_image_current(self, savename, fingerprint, extension='.png', **kwargs):
+        """
+
+        """
+        if not self.is_render_cached:
+            return False
+        if not os.path.isfile(self.get_image_path(savename, extension)):
+            return False
+        try:
+            with open(self.get_fingerprint_path(savename, extension), 'r') as fingerprint_file:
+                previous_fingerprint = fingerprint_file.read().strip()
+        except OSError:
+            return False
+        return previous_fingerprint == self.get_image_fingerprint(fingerprint, extension=extension, **kwargs)
+
+    @staticmethod
+    def get_tight_bbox(fig, pad_inches=0.1, dpi=None):
+        """
+
+        """
+        ## text extents depend on the dpi, and the layout of an expanded legend is only known after a draw
+        original_dpi = fig.dpi
+        if dpi is not None:
+            fig.set_dpi(dpi)
+        try:
+            fig.canvas.draw()
+            bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(pad_inches)
+        finally:
+            fig.set_dpi(original_dpi)
+        return bbox
+
+    def autocorrect_bbox(self, fig, bbox_inches, pad_inches=0.1, dpi=None):
+        """
+
+        """
+        if bbox_inches is None or isinstance(bbox_inches, Bbox):
+            return bbox_inches
+        if isinstance(bbox_inches, str):
+            if bbox_inches != 'tight':
+                raise ValueError("invalid bbox_inches: {}".format(bbox_inches))
+            return self.get_tight_bbox(fig, pad_inches, dpi)
+        ## precomputed (x0, y0, x1, y1) extents of the saved area in inches (measured from the bottom-left corner of the figure) skip the tight-bbox pass
+        if len(bbox_inches) != 4:
+            raise ValueError("invalid bbox_inches: {}".format(bbox_inches))
+        return Bbox.from_extents(*bbox_inches)
+
+    @staticmethod
+    def rasterize_lines(fig):
+        """
+
+        """
+        for ax in fig.axes:
+            for artist in ax.lines + ax.collections:
+                artist.set_rasterized(True)
+
+    def get_image_array(self, fig, dpi=800, bbox_inches='tight', pad_inches=0.1):
+        """
+
+        """
+        bbox = self.autocorrect_bbox(fig, bbox_inches, pad_inches, dpi)
+        if bbox is None:
+            width, height = fig.get_figwidth(), fig.get_figheight()
+        else:
+            width, height = bbox.width, bbox.height
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='raw', dpi=dpi, bbox_inches=bbox)
+        array = np.frombuffer(buffer.getvalue(), dtype=np.uint8)
+        npixels = array.size // 4
+        ## the canvas size is truncated from floats and may differ from ours by one pixel
+        for ncols in (int(width * dpi), int(width * dpi) + 1, int(width * dpi) - 1):
+            if npixels % ncols == 0 and abs(npixels // ncols - height * dpi) <= 1:
+                return array.reshape((npixels // ncols, ncols, 4))
+        raise ValueError("could not infer the shape of the rendered image")
+
+    @staticmethod
+    def save_image_array(array, savepath, extension='.png', size=None, **kwargs):
+        """
+
+        """
+        if Image is None:
+            raise ValueError("Pillow is required to encode {} images from a single draw".format(extension))
+        formats = {'.png' : 'PNG', '.jpg' : 'JPEG', '.jpeg' : 'JPEG', '.webp' : 'WEBP'}
+        if extension not in formats:
+            raise ValueError("invalid raster extension: {}".format(extension))
+        image = Image.fromarray(array, 'RGBA')
+        if size is not None:
+            image = image.resize(size, Image.LANCZOS)
+        if formats[extension] == 'JPEG':
+            image = image.convert('RGB')
+        image.save(savepath, format=formats[extension], **kwargs)
+
+    def get_thumbnail_target(self, savename, thumbnail):
+        """
+
+        """
+        if 'buffer' in thumbnail:
+            return thumbnail['buffer']
+        if not isinstance(savename, str):
+            raise ValueError("thumbnails of an in-memory image require a buffer")
+        suffix = thumbnail.get('suffix', '__{}dpi'.format(thumbnail['dpi']))
+        return self.get_image_path(savename + suffix, thumbnail.get('extension', '.png'))
+
+    def save_thumbnails(self, fig, savename, thumbnails, array=None, dpi=800, bbox_inches='tight', pad_inches=0.1):
+        """
+
+        """
+        if array is None:
+            ## no raster of the full image to share; draw once at the largest thumbnail resolution
+            dpi = max(thumbnail['dpi'] for thumbnail in thumbnails)
+            array = self.get_image_array(fig, dpi, bbox_inches, pad_inches)
+        height, width = array.shape[:2]
+        for thumbnail in thumbnails:
+            pil_kwargs = {key : value for key, value in thumbnail.items() if key not in ('dpi', 'extension', 'suffix', 'buffer')}
+            size = (max(1, int(round(width * thumbnail['dpi'] / dpi))), max(1, int(round(height * thumbnail['dpi'] / dpi))))
+            target = self.get_thumbnail_target(savename, thumbnail)
+            self.save_image_array(array, target, thumbnail.get('extension', '.png'), size, **pil_kwargs)
+
+    def save_image(self, fig, savepath, savename=None, dpi=800, bbox_inches='tight', pad_inches=0.1, extension='.png', thumbnails=None, rasterized=False, **kwargs):
+        """
+
+        """
+        if rasterized:
+            self.rasterize_lines(fig)
+        if thumbnails and extension in ('.png', '.jpg', '.jpeg', '.webp'):
+            ## one Agg draw is encoded into the full image and every thumbnail
+            array = self.get_image_array(fig, dpi, bbox_inches, pad_inches)
+            self.save_image_array(array, savepath, extension, **kwargs.get('pil_kwargs', dict()))
+            self.save_thumbnails(fig, savename, thumbnails, array, dpi)
+            return
+        if extension == '.webp':
+            ## matplotlib has no WebP writer of its own
+            array = self.get_image_array(fig, dpi, bbox_inches, pad_inches)
+            self.save_image_array(array, savepath, extension, **kwargs.get('pil_kwargs', dict()))
+        else:
+            if bbox_inches != 'tight':
+                bbox_inches = self.autocorrect_bbox(fig, bbox_inches, pad_inches)
+            if not isinstance(savepath, str):
+                kwargs.setdefault('format', extension[1:])
+            fig.savefig(savepath, dpi=dpi, bbox_inches=bbox_inches, pad_inches=pad_inches, **kwargs)
+        if thumbnails:
+            self.save_thumbnails(fig, savename, thumbnails, None, dpi, bbox_inches, pad_inches)
+
+    def display_image(self, fig, savename=None, dpi=800, bbox_inches='tight', pad_inches=0.1, extension='.png', fingerprint=None, close=True, thumbnails=None, rasterized=False, **kwargs):
         """
 
         """
         if savename is None:
             plt.show()
         elif isinstance(savename, str):
-            savepath = '{}Figures/{}{}'.format(self.directory, savename, extension)
-            fig.savefig(savepath, dpi=dpi, bbox_inches=bbox_inches, pad_inches=pad_inches, **kwargs)
+            savepath = self.get_image_path(savename, extension)
+            fingerprint_path = self.get_fingerprint_path(savename, extension)
+            if fingerprint is not None:
+                options = dict(kwargs)
+                if thumbnails:
+                    options['thumbnails'] = thumbnails
+                if rasterized:
+                    options['rasterized'] = rasterized
+                fingerprint = self.get_image_fingerprint(fingerprint, dpi, bbox_inches, pad_inches, extension, **options)
+                if self.is_render_cached and os.path.isfile(savepath) and os.path.isfile(fingerprint_path):
+                    with open(fingerprint_path, 'r') as fingerprint_file:
+                        if fingerprint_file.read().strip() == fingerprint:
+                            if close:
+                                plt.close(fig)
+                            return
+            self.save_image(fig, savepath, savename, dpi, bbox_inches, pad_inches, extension, thumbnails, rasterized, **kwargs)
+            if fingerprint is None:
+                if os.path.isfile(fingerprint_path):
+                    os.remove(fingerprint_path)
+            else:
+                os.makedirs(os.path.dirname(fingerprint_path), exist_ok=True)
+                with open(fingerprint_path, 'w') as fingerprint_file:
+                    fingerprint_file.write(fingerprint)
+        elif hasattr(savename, 'write'):
+            ## in-memory output; nothing is written to the Figures directory
+            self.save_image(fig, savename, savename, dpi, bbox_inches, pad_inches, extension, thumbnails, rasterized, **kwargs)
         else:
             raise ValueError("invalid type(savename): {}".format(type(savename)))
-        plt.close(fig)
+        if close:
+            plt.close(fig)
+
+## state of each render worker process; set once by initialize_render_worker
+_render_worker = {}
+
+def initialize_render_worker(settings, x, plot_kwargs, is_render_cached=True):
+    """
+
+    """
+    plt.switch_backend('Agg')
+    _render_worker['visual'] = VisualConfiguration(**settings)
+    ## a forced re-render of the parent also applies to its workers
+    _render_worker['visual'].is_render_cached = is_render_cached
+    _render_worker['x'] = x
+    _render_worker['plot_kwargs'] = plot_kwargs
+
+def render_case_comparison_figure(task):
+    """
+
+    """
+    title, savename, fingerprint, confirmed, dead, recovered = task
+    visual = _render_worker['visual']
+    result = {'title' : title, 'path' : visual.get_image_path(savename), 'seconds' : None, 'error' : None, 'skipped' : False}
+    start = time.perf_counter()
+    try:
+        if 'template' not in _render_worker:
+            _render_worker['template'] = visual.get_case_comparison_template(_render_worker['x'], **_render_worker['plot_kwargs'])
+        fig = visual.update_case_comparison_template(_render_worker['template'], title, (confirmed, dead, recovered))
+        visual.display_image(fig, savename, dpi=_render_worker['template']['dpi'], fingerprint=fingerprint, close=False)
+    except Exception:
+        result['error'] = traceback.format_exc()
+        plt.close('all')
+        _render_worker.pop('template', None)
+    result['seconds'] = time.perf_counter() - start
+    return result